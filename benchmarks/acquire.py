@@ -0,0 +1,67 @@
+"""
+Micro-benchmark of PgShard.acquire overhead
+
+Pools are replaced with in-memory stubs, so only the routing, locking and
+bookkeeping of the acquire/release path is measured
+
+python -m benchmarks.acquire [iterations] [concurrency]
+"""
+
+import asyncio
+import sys
+import time
+
+from consql._db import PgShard
+
+
+class _Connection:
+    pass
+
+class _Proxy:
+    def __init__(self):
+        self._con = _Connection()
+
+class _Pool:
+    async def acquire(self, timeout=None):
+        return _Proxy()
+
+    async def release(self, conn):
+        pass
+
+
+async def _noop():
+    pass
+
+async def _worker(shard, iterations):
+    for _ in range(iterations):
+        async with shard(mode='master'):
+            pass
+
+async def main(iterations=100000, concurrency=100):
+    shard = PgShard('host=localhost dbname=bench user=bench password=bench')
+    shard._check = _noop
+
+    for stat_host in shard.stat.values():
+        stat_host['pool'] = _Pool()
+        stat_host['mode'] = 'master'
+
+    per_worker = iterations // concurrency
+
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        _worker(shard, per_worker)
+        for _ in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - started
+
+    total = per_worker * concurrency
+    print(
+        f'{total} acquires, concurrency {concurrency}: '
+        f'{elapsed:.3f} s, {elapsed / total * 1e6:.2f} us/acquire'
+    )
+
+    await shard.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(*map(int, sys.argv[1:3])))
@@ -2,8 +2,13 @@
 Initializing the Python package
 """
 
+from ._db import LsnToken
+from ._deadline import deadline
+from ._identity import identity_map
+from ._unit import UnitOfWork
 from .model import Attribute, Extra
 from .main import make_base
+from .routers import JumpHashRouter, HashRingRouter
 from .table import Table
 
 
@@ -13,6 +18,12 @@ __all__ = (
     '__version__',
     'Attribute',
     'Extra',
+    'HashRingRouter',
+    'JumpHashRouter',
+    'LsnToken',
     'Table',
+    'UnitOfWork',
+    'deadline',
+    'identity_map',
     'make_base',
 )
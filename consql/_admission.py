@@ -0,0 +1,183 @@
+"""
+Admission control of connection acquires
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+
+from .errors import ErrorOverload, ErrorWrong
+
+
+DEFAULT_CLASSES = {
+    'interactive': {'priority': 0},
+    'default': {'priority': 1},
+    'background': {'priority': 2},
+}
+
+
+class Admission:
+    """ Bounded priority queue in front of the shard pools
+
+    Requests are admitted by the priority of their class within the total
+    and per-class concurrency. When the queue is full or the estimated
+    wait exceeds `max_wait` the request is rejected at once
+    """
+
+    hold_alpha = 0.2
+
+    def __init__(
+        self,
+        *,
+        concurrency: int = 10,
+        classes: dict = None,
+        default: str = 'default',
+        queue_size: int = 1000,
+        max_wait: float = 1,
+    ):
+        self.concurrency = concurrency
+        self.classes = {
+            name: {
+                'priority': params.get('priority', 0),
+                'limit': params.get('limit'),
+                'active': 0,
+                'rejected': 0,
+            }
+            for name, params in (classes or DEFAULT_CLASSES).items()
+        }
+        self.default = default
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.active = 0
+        self.hold = None
+        self.waiters = []
+        self._seq = itertools.count()
+
+        if self.default not in self.classes:
+            raise ErrorWrong(f'Unknown priority: {self.default}')
+
+    def __len__(self):
+        return len(self.waiters)
+
+    def _class(self, priority):
+        if priority is None:
+            priority = self.default
+
+        if priority not in self.classes:
+            raise ErrorWrong(f'Unknown priority: {priority}')
+
+        return priority
+
+    def _allowed(self, name) -> bool:
+        klass = self.classes[name]
+
+        if self.active >= self.concurrency:
+            return False
+
+        return klass['limit'] is None or klass['active'] < klass['limit']
+
+    def _admit(self, name) -> float:
+        self.active += 1
+        self.classes[name]['active'] += 1
+        return time.monotonic()
+
+    def estimate(self, name) -> float:
+        """ Expected wait of a new request of the class """
+
+        if self.hold is None:
+            return 0
+
+        priority = self.classes[name]['priority']
+        ahead = sum(
+            1 for waiter in self.waiters
+            if waiter[0] <= priority
+        )
+
+        return (ahead + 1) * self.hold / self.concurrency
+
+    async def acquire(self, priority=None, timeout=None):
+        """ Wait for the turn of the request
+
+        Returns the token to pass to `release`
+        """
+
+        name = self._class(priority)
+        klass = self.classes[name]
+
+        # Waiters are dispatched on every release, so the remaining ones
+        # are held by the limits of their classes
+        if self._allowed(name):
+            return name, self._admit(name)
+
+        if (
+            len(self.waiters) >= self.queue_size
+            or self.estimate(name) > self.max_wait
+        ):
+            klass['rejected'] += 1
+            raise ErrorOverload(f'Admission {name}: {len(self.waiters)}')
+
+        waiter = asyncio.get_running_loop().create_future()
+        entry = [klass['priority'], next(self._seq), name, waiter]
+        heapq.heappush(self.waiters, entry)
+
+        try:
+            return name, await asyncio.wait_for(waiter, timeout=timeout)
+
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            if waiter.done() and not waiter.cancelled():
+                self.release((name, waiter.result()))
+            elif entry in self.waiters:
+                self.waiters.remove(entry)
+                heapq.heapify(self.waiters)
+            raise
+
+    def release(self, token) -> None:
+        name, admitted = token
+
+        self.active -= 1
+        self.classes[name]['active'] -= 1
+
+        hold = time.monotonic() - admitted
+        if self.hold is None:
+            self.hold = hold
+        else:
+            self.hold += self.hold_alpha * (hold - self.hold)
+
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """ Admit waiters by priority, skipping classes at their limit """
+
+        skipped = []
+
+        while self.waiters and self.active < self.concurrency:
+            entry = heapq.heappop(self.waiters)
+            name, waiter = entry[2], entry[3]
+
+            if waiter.done():
+                continue
+
+            if not self._allowed(name):
+                skipped.append(entry)
+                continue
+
+            waiter.set_result(self._admit(name))
+
+        for entry in skipped:
+            heapq.heappush(self.waiters, entry)
+
+    def json(self):
+        return {
+            'active': self.active,
+            'queued': len(self.waiters),
+            'hold': self.hold,
+            'classes': {
+                name: {
+                    'active': klass['active'],
+                    'limit': klass['limit'],
+                    'rejected': klass['rejected'],
+                }
+                for name, klass in self.classes.items()
+            },
+        }
@@ -0,0 +1,327 @@
+"""
+Caches of the rows by the keys and of the query results
+"""
+
+import collections
+import copy
+import functools
+import time
+
+from ._db import SESSION
+
+
+CACHES = {}
+
+
+class ModelCache:
+    """ LRU cache of the rows of one model with expiration
+
+    Rows are kept by the primary key and every unique key of the table,
+    lookups of missing rows are cached for `negative_ttl` seconds. A row
+    fetched while the model was changed is not cached
+    """
+
+    def __init__(self, size=10000, ttl=60, negative_ttl=5):
+        self.size = size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.entries = collections.OrderedDict()
+        self.aliases = {}
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key_def, key):
+        """ Whether the lookup is cached and the row or `None` """
+
+        name = (tuple(key_def), tuple(key))
+        entry = self.entries.get(name)
+
+        if entry is None:
+            self.misses += 1
+            return False, None
+
+        expires, _, row = entry
+
+        if expires <= time.monotonic():
+            self._drop(name)
+            self.misses += 1
+            return False, None
+
+        self.entries.move_to_end(name)
+        self.hits += 1
+        return True, row
+
+    def snapshot(self):
+        """ Version of the model to pass to `put` and `miss` """
+
+        return self.generation
+
+    def put(self, table, row, snapshot=None):
+        """ Cache the row by all keys of the table """
+
+        if snapshot is not None and snapshot != self.generation:
+            return
+
+        # Instances are built from copies, so the cached row is never shared
+        row = copy.deepcopy(dict(row))
+        pkey = tuple(row[name] for name in table.pkey)
+        self._forget(table, pkey)
+
+        expires = time.monotonic() + self.ttl
+        aliases = self.aliases.setdefault(pkey, set())
+
+        for key_def in (table.pkey, *table.keys.values()):
+            key = tuple(row.get(name) for name in key_def)
+            if any(value is None for value in key):
+                continue
+
+            name = (tuple(key_def), key)
+            self._drop(name)
+            self.entries[name] = (expires, pkey, row)
+            aliases.add(name)
+
+        self._evict()
+
+    def miss(self, key_def, key, snapshot=None):
+        """ Cache the absence of the row """
+
+        if not self.negative_ttl:
+            return
+        if snapshot is not None and snapshot != self.generation:
+            return
+
+        name = (tuple(key_def), tuple(key))
+        self._drop(name)
+        self.entries[name] = (
+            time.monotonic() + self.negative_ttl, None, None,
+        )
+        self._evict()
+
+    def invalidate(self, table, pkey, row=None):
+        """ Forget the row by all its keys
+
+        With the values of the row the lookups that missed it by its
+        current unique keys are forgotten too
+        """
+
+        self.generation += 1
+        self._forget(table, pkey, row)
+
+    def _forget(self, table, pkey, row=None):
+        for name in self.aliases.pop(tuple(pkey), ()):
+            self.entries.pop(name, None)
+
+        self.entries.pop((tuple(table.pkey), tuple(pkey)), None)
+
+        if row is not None:
+            for key_def in table.keys.values():
+                self.entries.pop((
+                    tuple(key_def),
+                    tuple(row.get(name) for name in key_def),
+                ), None)
+
+    def clear(self):
+        self.generation += 1
+        self.entries.clear()
+        self.aliases.clear()
+
+    def _drop(self, name):
+        entry = self.entries.pop(name, None)
+        if entry is None or entry[1] is None:
+            return
+
+        aliases = self.aliases.get(entry[1])
+        if aliases is not None:
+            aliases.discard(name)
+            if not aliases:
+                del self.aliases[entry[1]]
+
+    def _evict(self):
+        while len(self.entries) > self.size:
+            name = next(iter(self.entries))
+            self._drop(name)
+            self.evictions += 1
+
+    def json(self):
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+class ResultCache:
+    """ LRU cache of the query results tagged by the tables
+
+    Results are dropped when any of their tables is changed, a result
+    fetched while its table was changed is not cached
+    """
+
+    def __init__(self, size=1000):
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.tags = {}
+        self.generations = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """ Copy of the cached rows or `None` """
+
+        entry = self.entries.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires, _, rows = entry
+
+        if expires <= time.monotonic():
+            self._drop(key)
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return list(rows)
+
+    def snapshot(self, tags):
+        """ Versions of the tables to pass to `put` """
+
+        return tuple(self.generations.get(tag, 0) for tag in tags)
+
+    def put(self, key, rows, ttl, tags, snapshot):
+        if self.snapshot(tags) != snapshot:
+            return
+
+        self._drop(key)
+        self.entries[key] = (time.monotonic() + ttl, tuple(tags), list(rows))
+
+        for tag in tags:
+            self.tags.setdefault(tag, set()).add(key)
+
+        while len(self.entries) > self.size:
+            self._drop(next(iter(self.entries)))
+            self.evictions += 1
+
+    def invalidate(self, tag):
+        """ Drop the results of the table """
+
+        self.generations[tag] = self.generations.get(tag, 0) + 1
+
+        for key in self.tags.pop(tag, ()):
+            self._drop(key)
+
+    def clear(self):
+        self.entries.clear()
+        self.tags.clear()
+
+    def _drop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+
+        for tag in entry[1]:
+            keys = self.tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tags[tag]
+
+    def json(self):
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+RESULTS = ResultCache()
+
+
+def cache_of(model):
+    """ Cache of the model by its `cache` option or `None`
+
+    The option is `True` or the arguments of `ModelCache`, e.g.
+    `cache={'size': 50000, 'ttl': 30}`
+    """
+
+    if model in CACHES:
+        return CACHES[model]
+
+    options = getattr(model.meta, 'cache', None)
+
+    if not options:
+        cache = None
+    elif options is True:
+        cache = ModelCache()
+    else:
+        cache = ModelCache(**options)
+
+    CACHES[model] = cache
+    return cache
+
+def _now_and_on_commit(callback):
+    """ Call the function and again once the session commits
+
+    Until the commit readers outside the transaction still see the old
+    rows and may cache them after the first call
+    """
+
+    callback()
+
+    session = SESSION.get()
+    if session is not None and session.transaction:
+        session.after_commit(callback)
+
+def expire_results(model):
+    """ Drop the cached results of queries by the table of the model """
+
+    _now_and_on_commit(functools.partial(
+        RESULTS.invalidate, model.meta.table.name,
+    ))
+
+def invalidate(instance):
+    """ Forget the row of the instance in the caches of its model """
+
+    expire_results(type(instance))
+
+    cache = cache_of(type(instance))
+    if cache is None:
+        return
+
+    _now_and_on_commit(functools.partial(
+        cache.invalidate,
+        instance.meta.table,
+        tuple(instance.get_key()),
+        {name: getattr(instance, name) for name in instance.meta.fields},
+    ))
+
+def forget(model, key):
+    """ Forget the row of the model by the primary key """
+
+    cache = cache_of(model)
+    if cache is not None:
+        _now_and_on_commit(functools.partial(
+            cache.invalidate, model.meta.table, tuple(key),
+        ))
+
+def expire(model):
+    """ Forget all rows of the model in the caches """
+
+    expire_results(model)
+
+    cache = cache_of(model)
+    if cache is not None:
+        _now_and_on_commit(cache.clear)
@@ -3,8 +3,12 @@ Database
 """
 
 import asyncio
+import collections
+import contextvars
+import os
 import random
 import sys
+import time
 import copy
 import re
 import ssl
@@ -15,7 +19,11 @@ from asyncpg.connection import Connection
 from asyncpg.exceptions import InterfaceError, PostgresConnectionError
 from asyncpg.pool import Pool, PoolConnectionProxy
 
-from .errors import ErrorWrong
+from ._admission import Admission
+from ._deadline import detached, expired, remaining
+from ._metrics import HostMetrics, render_prometheus
+from .errors import ErrorInvalid, ErrorWrong
+from .routers import JumpHashRouter
 
 
 PG_DEFAULT_DB = 'main'
@@ -49,7 +57,24 @@ DBS = {
     },
 }
 CHECK_QUERY = '''SELECT pg_is_in_recovery() AS "replica", COALESCE(
-    EXTRACT(epoch FROM NOW() - pg_last_xact_replay_timestamp()), 0) AS "lag"
+    EXTRACT(epoch FROM NOW() - pg_last_xact_replay_timestamp()), 0) AS "lag",
+    CASE WHEN pg_is_in_recovery()
+        THEN COALESCE(pg_last_wal_replay_lsn(), '0/0'::PG_LSN)
+        ELSE pg_current_wal_lsn()
+    END AS "lsn"
+'''
+CONNECTION_ERRORS = (
+    OSError,
+    ConnectionError,
+    PostgresConnectionError,
+    InterfaceError,
+)
+SESSION = contextvars.ContextVar('consql_session', default=None)
+READ_METHODS = ('fetch', 'fetchrow', 'fetchval')
+READ_QUERY = re.compile(r'^\s*(SELECT|VALUES|TABLE)\b', re.IGNORECASE)
+WRITE_LSN_QUERY = 'SELECT pg_current_wal_lsn()'
+REPLAY_LSN_QUERY = '''SELECT COALESCE(
+    pg_last_wal_replay_lsn(), '0/0'::PG_LSN)
 '''
 
 
@@ -110,44 +135,502 @@ class PgDsnParser:
 
         return connect_kwargs
 
+class LsnToken:
+    """ Position of the latest write of the session
+
+    Reads with the token are served by replicas that have replayed it
+    """
+
+    __slots__ = ('lsns',)
+
+    def __init__(self, data=None):
+        self.lsns = {}
+
+        if isinstance(data, str):
+            for item in filter(None, data.split(',')):
+                db, shardno, lsn = item.rsplit(':', 2)
+                self.lsns[(db, int(shardno))] = int(lsn)
+
+        elif data:
+            self.lsns.update(data)
+
+    def __str__(self):
+        return ','.join(
+            f'{db}:{shardno}:{lsn}'
+            for (db, shardno), lsn in self.lsns.items()
+        )
+
+    def __repr__(self):
+        return f'<LsnToken {self}>'
+
+    def __bool__(self):
+        return bool(self.lsns)
+
+    def get(self, db, shardno):
+        return self.lsns.get((db, shardno), 0)
+
+    def update(self, db, shardno, lsn):
+        if lsn and lsn > self.get(db, shardno):
+            self.lsns[(db, shardno)] = lsn
+
+class Session:
+    """ Connections pinned for the scope, one per shard of the database
+
+    Connection contexts and queries of the database inside the scope use
+    the pinned connection when its mode serves them: a master session
+    serves all modes, a replica one only its own. With `transaction`
+    all of them run in a transaction per shard, committed on exit
+    """
+
+    def __init__(
+        self,
+        db: str,
+        *,
+        mode: str = 'master',
+        transaction: bool = False,
+        isolation: str = None,
+        priority: str = None,
+    ):
+        self.db = db
+        self.mode = mode
+        self.transaction = transaction
+        self.isolation = isolation
+        self.priority = priority
+        self.pinned = {}
+        self.committed = []
+        self._token = None
+
+    def covers(self, pgshard, mode) -> bool:
+        return pgshard.name == self.db and (
+            self.mode == 'master' or mode == self.mode
+        )
+
+    async def enter(self, pgshard):
+        """ Take the pinned connection of the shard for exclusive use """
+
+        entry = self.pinned.get(pgshard)
+        if entry is None:
+            entry = self.pinned[pgshard] = {
+                'lock': asyncio.Lock(),
+                'pool': None,
+                'conn': None,
+                'transaction': None,
+                'tokens': [],
+            }
+
+        await entry['lock'].acquire()
+
+        try:
+            if entry['conn'] is None:
+                await self._pin(pgshard, entry)
+        except BaseException:
+            entry['lock'].release()
+            raise
+
+        return entry['conn']
+
+    def leave(self, pgshard) -> None:
+        self.pinned[pgshard]['lock'].release()
+
+    def after_commit(self, callback) -> None:
+        """ Call the function once the transactions have committed """
+
+        self.committed.append(callback)
+
+    def track(self, pgshard, token) -> None:
+        """ Update the token with the position of the shard on exit
+
+        The commit is written after the statements of the transaction, so
+        the position is only read once it has succeeded
+        """
+
+        tokens = self.pinned[pgshard]['tokens']
+        if all(known is not token for known in tokens):
+            tokens.append(token)
+
+    async def _pin(self, pgshard, entry):
+        pool, conn = await pgshard.acquire(self.mode, priority=self.priority)
+
+        if self.transaction:
+            transaction = conn.transaction(isolation=self.isolation)
+
+            try:
+                await transaction.start()
+            except BaseException:
+                await pgshard.release(pool, conn)
+                raise
+
+            entry['transaction'] = transaction
+
+        entry['pool'], entry['conn'] = pool, conn
+
+    async def __aenter__(self):
+        self._token = SESSION.set(self)
+        return self
+
+    async def __aexit__(self, extype, extvalue, extraceback):
+        SESSION.reset(self._token)
+        self._token = None
+        pinned, self.pinned = self.pinned, {}
+        committed, self.committed = self.committed, []
+        error = None
+
+        for pgshard, entry in pinned.items():
+            if entry['conn'] is None:
+                continue
+
+            try:
+                if entry['transaction'] is not None:
+                    if extype is None and error is None:
+                        await entry['transaction'].commit()
+                    else:
+                        await entry['transaction'].rollback()
+
+                if extype is None and error is None and entry['tokens']:
+                    lsn = await entry['conn'].fetchval(WRITE_LSN_QUERY)
+                    for token in entry['tokens']:
+                        token.update(pgshard.name, pgshard.shardno, lsn)
+
+            except Exception as e:  # pylint: disable=broad-except
+                if error is None:
+                    error = e
+
+            finally:
+                await pgshard.release(entry['pool'], entry['conn'])
+
+        if error is not None and extype is None:
+            raise error
+
+        if extype is None:
+            for callback in committed:
+                callback()
+
 class PgShardConnectionContext:
-    __slots__ = ('pgshard', 'mode', 'pool', 'conn',)
+    __slots__ = (
+        'pgshard', 'mode', 'token', 'max_lag', 'priority', 'pool', 'conn',
+        'session',
+    )
 
-    def __init__(self, pgshard, mode):
+    def __init__(self, pgshard, mode, token=None, max_lag=None, priority=None):
         self.pgshard = pgshard
         self.mode = mode
+        self.token = token
+        self.max_lag = max_lag
+        self.priority = priority
         self.pool = None
         self.conn = None
+        self.session = None
 
     async def __aenter__(self):
-        self.pool, self.conn = await self.pgshard.acquire(self.mode)
+        session = SESSION.get()
+
+        if session is not None and session.covers(self.pgshard, self.mode):
+            self.conn = await session.enter(self.pgshard)
+            self.session = session
+            return self.conn
+
+        self.pool, self.conn = await self.pgshard.acquire(
+            self.mode,
+            token=self.token,
+            max_lag=self.max_lag,
+            priority=self.priority,
+        )
 
         return self.conn
 
     async def __aexit__(self, extype, extvalue, extraceback):
-        pool, conn = self.pool, self.conn
-        self.pool, self.conn = None, None
+        pool, conn, session = self.pool, self.conn, self.session
+        self.pool, self.conn, self.session = None, None, None
+
+        try:
+            if (
+                extype is None
+                and self.token is not None
+                and conn._con.mode == 'master'
+                and self.mode == 'master'
+            ):
+                # Writes of the session are visible after its commit
+                if session is not None:
+                    session.track(self.pgshard, self.token)
+                    return
+
+                self.token.update(
+                    self.pgshard.name,
+                    self.pgshard.shardno,
+                    await conn.fetchval(WRITE_LSN_QUERY),
+                )
 
-        await pool.release(conn)
+        finally:
+            if session is not None:
+                session.leave(self.pgshard)
+            else:
+                await self.pgshard.release(pool, conn)
 
 class PgShardConnection(Connection):
     hostno = 0
     mode = 'not_connected'
     shardno = 0
     name = None
+    stat_host = None
+    ticket = None
+
+    latency_alpha = 0.2
 
     def __repr__(self):
         return '<PgShardConnection[{}].{}#{}>'.format(
             self.name, self.mode, self.shardno,
         )
 
+    def _deadline(self, kwargs):
+        """ Shrink the statement timeout to the deadline of the scope """
+
+        kwargs['timeout'] = remaining(
+            kwargs.get('timeout') or self._config.command_timeout
+        )
+        return kwargs
+
+    async def _timed(self, coro):
+        started = time.monotonic()
+
+        try:
+            return await coro
+        except asyncio.TimeoutError:
+            if self.stat_host is not None:
+                self.stat_host['metrics'].query_timeouts += 1
+            raise
+        finally:
+            self._observe(time.monotonic() - started)
+
+    def _observe(self, duration):
+        """ Update EWMA of the query latency of the host """
+
+        if self.stat_host is not None:
+            self._update_latency(self.stat_host, duration)
+
+    def _update_latency(self, stat_host, duration):
+        stat_host['metrics'].query.observe(duration)
+
+        latency = stat_host['latency']
+        if latency is None:
+            stat_host['latency'] = duration
+        else:
+            stat_host['latency'] = (
+                latency + self.latency_alpha * (duration - latency)
+            )
+
+    async def execute(self, query, *args, **kwargs):
+        return await self._timed(super().execute(
+            query, *args, **self._deadline(kwargs),
+        ))
+
+    async def executemany(self, command, args, **kwargs):
+        return await self._timed(super().executemany(
+            command, args, **self._deadline(kwargs),
+        ))
+
+    async def fetch(self, query, *args, **kwargs):
+        return await self._timed(super().fetch(
+            query, *args, **self._deadline(kwargs),
+        ))
+
+    async def fetchrow(self, query, *args, **kwargs):
+        return await self._timed(super().fetchrow(
+            query, *args, **self._deadline(kwargs),
+        ))
+
+    async def fetchval(self, query, *args, **kwargs):
+        return await self._timed(super().fetchval(
+            query, *args, **self._deadline(kwargs),
+        ))
+
+class PoolLimiter:
+    """ Limit of connections taken from the pool, adjustable at runtime
+
+    Also collects the acquire wait and peak usage for autoscaling
+    """
+
+    __slots__ = ('limit', 'active', 'waiters', 'waited', 'acquired', 'peak')
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self.waiters = collections.deque()
+        self.waited = 0
+        self.acquired = 0
+        self.peak = 0
+
+    def reset(self) -> None:
+        self.waited = 0
+        self.acquired = 0
+        self.peak = self.active
+
+    def try_acquire(self) -> bool:
+        """ Take the slot without waiting if it's free """
+
+        if self.active >= self.limit or self.waiters:
+            return False
+
+        self.active += 1
+        if self.active > self.peak:
+            self.peak = self.active
+        return True
+
+    async def acquire(self, timeout: float = None) -> None:
+        if self.try_acquire():
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+
+        try:
+            await asyncio.wait_for(waiter, timeout=timeout)
+
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                try:
+                    self.waiters.remove(waiter)
+                except ValueError:
+                    pass
+            raise
+
+    def release(self) -> None:
+        self.active -= 1
+        self._wake()
+
+    def record(self, wait: float) -> None:
+        self.waited += wait
+        self.acquired += 1
+
+    def resize(self, limit: int) -> None:
+        self.limit = limit
+        self._wake()
+
+    def _wake(self) -> None:
+        while self.waiters and self.active < self.limit:
+            waiter = self.waiters.popleft()
+
+            if waiter.done():
+                continue
+
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            waiter.set_result(None)
+
+class RetryBudget:
+    """ Retries allowed as a share of requests
+
+    Each request deposits `ratio` of a retry, up to `burst`, so retries
+    stop when failures are not transient instead of multiplying the load
+    """
+
+    __slots__ = ('ratio', 'burst', 'tokens')
+
+    def __init__(self, ratio: float = 0.1, burst: float = 10):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+
+    def deposit(self) -> None:
+        self.tokens = min(self.tokens + self.ratio, self.burst)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            return False
+
+        self.tokens -= 1
+        return True
+
+class HealthScheduler:
+    """ Health checks of the hosts of all registered shards
+
+    One task sleeps until the nearest due probe or an explicit wakeup
+    instead of a polling loop per shard. Each probe runs in its own task,
+    so a host that hangs until the connect timeout doesn't delay others
+    """
+
+    def __init__(self):
+        self.shards = set()
+        self.probes = set()
+        self.task = None
+        self.wakeup = None
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def add(self, shard) -> None:
+        self.shards.add(shard)
+
+        if (
+            not self.running
+            or self.task.get_loop() is not asyncio.get_running_loop()
+        ):
+            self.wakeup = asyncio.Event()
+            # Probes must outlive the deadline of the first request
+            self.task = detached(self._run())
+
+        else:
+            self.wake()
+
+    def discard(self, shard) -> None:
+        self.shards.discard(shard)
+        self.wake()
+
+    def wake(self) -> None:
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    def _probed(self, probe) -> None:
+        self.probes.discard(probe)
+
+        # Failures are counted by the shard
+        if not probe.cancelled():
+            probe.exception()
+
+        self.wake()
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        while self.shards:
+            self.wakeup.clear()
+
+            for shard in list(self.shards):
+                for hostno in shard._due():
+                    probe = asyncio.ensure_future(shard._probe(hostno))
+                    probe.add_done_callback(self._probed)
+                    self.probes.add(probe)
+
+            check_at = min(
+                (shard.check_at for shard in self.shards),
+                default=None,
+            )
+            if check_at is None:
+                break
+
+            try:
+                await asyncio.wait_for(
+                    self.wakeup.wait(),
+                    timeout=max(check_at - loop.time(), 0),
+                )
+            except asyncio.TimeoutError:
+                pass
+
 class PgShard:
     query_last_time = 0
-    check_last_time = 0
     check_interval = 10
-    check_sleep = 0.5
     check_is_running = False
-    check_task = None
+    check_backoff = 0.5
+    check_backoff_max = 30
+    scale_at = float('inf')
+    hedged = 0
+    hedge_wins = 0
+    hedge_min_samples = 20
+    hedge_refresh = 16
+    retries = 0
+    coalesced = 0
 
     slow_lag = 25
 
@@ -158,6 +641,8 @@ class PgShard:
         self.shardno = shardno
         self.loop = loop
         self.lock = asyncio.Lock()
+        # Tests run each case in a new event loop, pools are bound to it
+        self.track_loop = 'pytest' in sys.modules
         self.pool_min_size = opts.get('pool_min_size', 10)
         self.pool_max_size = opts.get('pool_max_size', 10)
         self.pool_max_queries = opts.get('pool_max_queries', 5000)
@@ -167,8 +652,41 @@ class PgShard:
         self.pool_timeout = opts.get('pool_timeout', 5)
         self.pool_acquire_timeout = opts.get('pool_acquire_timeout', 5)
         self.pool_query_timeout = opts.get('pool_query_timeout', 15)
+        self.pool_max_capacity = max(
+            opts.get('pool_max_capacity', self.pool_max_size),
+            self.pool_max_size,
+        )
+        self.pool_autoscale_interval = opts.get('pool_autoscale_interval', 1)
+        self.pool_autoscale_wait = opts.get('pool_autoscale_wait', 0.005)
+        self.balancer = opts.get('balancer', 'random')
+        self.hedge = opts.get('hedge', False)
+        self.hedge_percentile = opts.get('hedge_percentile', 95)
+        self.hedge_min_delay = opts.get('hedge_min_delay', 0.002)
+        self.read_latencies = collections.deque(
+            maxlen=opts.get('hedge_window', 500),
+        )
+        self._hedge_delay = None
+        self._hedge_reads = 0
+        self.retry_attempts = opts.get('retry_attempts', 2)
+        self.retry_budget = RetryBudget(
+            opts.get('retry_ratio', 0.1),
+            opts.get('retry_burst', 10),
+        )
+        self.singleflight = opts.get('singleflight', False)
+        self.flights = {}
+        self.scheduler = opts.get('scheduler') or HealthScheduler()
+        self.admission = None
         self.stat = {}
 
+        if opts.get('admission') is not None:
+            self.admission = Admission(**{
+                'concurrency': self.pool_max_size,
+                **opts['admission'],
+            })
+
+        if self.balancer not in ('random', 'p2c'):
+            raise ErrorWrong(f'Unknown balancer: {self.balancer}')
+
         for hostno, _ in enumerate(self.dsn.hosts):
             self.stat[hostno] = {
                 'no': hostno,
@@ -179,6 +697,16 @@ class PgShard:
                 'pool': None,
                 'mode': 'not_connected',
                 'inited': False,
+                'lsn': 0,
+                'lag': None,
+                'inflight': 0,
+                'latency': None,
+                'check_at': 0,
+                'probing': False,
+                'failures': 0,
+                'breaker': 'closed',
+                'metrics': HostMetrics(),
+                'limiter': PoolLimiter(self.pool_min_size),
             }
 
     def __repr__(self):
@@ -188,8 +716,15 @@ class PgShard:
             id=id(self),
         )
 
-    def __call__(self, *, mode: str = 'master') -> PgShardConnectionContext:
-        return PgShardConnectionContext(self, mode)
+    def __call__(
+        self,
+        *,
+        mode: str = 'master',
+        token: LsnToken = None,
+        max_lag: float = None,
+        priority: str = None,
+    ) -> PgShardConnectionContext:
+        return PgShardConnectionContext(self, mode, token, max_lag, priority)
 
     @property
     def is_connected(self) -> bool:
@@ -199,66 +734,498 @@ class PgShard:
 
         return False
 
-    async def acquire(self,  mode):
-        """ Get connection from the pool """
+    async def query(
+        self,
+        method: str,
+        sql: str,
+        *args,
+        singleflight: bool = None,
+        **opts,
+    ):
+        """ Run the statement with the connection method
+
+        With `singleflight` (by default the option of the shard) a read
+        identical to the one in flight by the SQL, arguments and routing
+        waits for its result instead of being sent. Each caller gets its
+        own copy of the rows as dicts, not records: code indexing the
+        columns by position must not turn it on. See `_query` for the
+        options
+        """
+
+        if singleflight is None:
+            singleflight = self.singleflight
+
+        if (
+            not singleflight
+            or method not in READ_METHODS
+            or not READ_QUERY.match(sql)
+            or SESSION.get() is not None
+        ):
+            return await self._query(method, sql, *args, **opts)
 
-        await self._loop_changed()
+        key = (
+            method,
+            sql,
+            repr(args),
+            repr(sorted(opts.items(), key=lambda item: item[0])),
+        )
+        flight = self.flights.get(key)
 
-        self.query_last_time = self.loop.time()
+        if flight is None:
+            # The flight must not end with the deadline of its first caller
+            flight = detached(self._query(method, sql, *args, **opts))
+            self.flights[key] = flight
 
-        async with self.lock:
-            if (
-                not self.check_is_running
-                or self.check_task is None
-                or self.check_task.done()
+            def land(_):
+                if self.flights.get(key) is flight:
+                    del self.flights[key]
+
+                # Nobody may be left to retrieve the error
+                if not flight.cancelled():
+                    flight.exception()
+
+            flight.add_done_callback(land)
+
+        else:
+            self.coalesced += 1
+
+        # The flight goes on for the others if the caller is cancelled
+        result = await asyncio.wait_for(asyncio.shield(flight), remaining())
+
+        if method == 'fetch':
+            return [copy.deepcopy(dict(row)) for row in result]
+
+        if method == 'fetchrow' and result is not None:
+            return copy.deepcopy(dict(result))
+
+        return copy.deepcopy(result)
+
+    async def _query(
+        self,
+        method: str,
+        sql: str,
+        *args,
+        mode: str = 'master',
+        token: LsnToken = None,
+        max_lag: float = None,
+        priority: str = None,
+        hedge: bool = None,
+    ):
+        """ Run the statement with the connection method
+
+        Reads from replicas are hedged when enabled for the shard or by
+        `hedge`: if the replica has not answered within the percentile of
+        recent read latencies, the statement is also sent to another
+        replica, the first result wins and the other one is cancelled.
+
+        On connection errors reads are retried on other hosts, writes only
+        if they have not got a connection, within the retry budget
+        """
+
+        opts = {
+            'mode': mode,
+            'token': token,
+            'max_lag': max_lag,
+            'priority': priority,
+        }
+
+        session = SESSION.get()
+
+        if mode == 'master' or session and session.covers(self, mode):
+            run = self._write
+        elif self.hedge if hedge is None else hedge:
+            run = self._hedged
+        else:
+            run = self._execute
+
+        hosts = set()
+        errors = []
+        self.retry_budget.deposit()
+
+        for attempt in range(self.retry_attempts + 1):
+            tried = len(hosts)
+
+            try:
+                return await run(method, sql, args, hosts, **opts)
+
+            except asyncio.TimeoutError:
+                raise
+
+            except ErrorWrong:
+                # No host is left for the retry
+                if not errors:
+                    raise
+                raise errors[-1] from None
+
+            except CONNECTION_ERRORS as e:
+                if (
+                    attempt == self.retry_attempts
+                    or run == self._write and len(hosts) > tried
+                    or not self.retry_budget.withdraw()
+                ):
+                    raise
+
+                errors.append(e)
+                self.retries += 1
+
+    async def _write(self, method, sql, args, hosts, **opts):
+        """ Run the statement in the connection context
+
+        Used for the master and the connections pinned by the session,
+        the host is added once the statement is sent
+        """
+
+        async with self(**opts) as conn:
+            hosts.add(conn._con.hostno)
+
+            try:
+                return await getattr(conn, method)(sql, *args)
+            except asyncio.TimeoutError:
+                raise
+            except CONNECTION_ERRORS:
+                self._recheck(conn._con.stat_host)
+                raise
+
+    async def _execute(self, method, sql, args, hosts, **opts):
+        """ Run the read on a host not from `hosts` and add the host """
+
+        started = time.monotonic()
+        pool, conn = await self.acquire(exclude=frozenset(hosts), **opts)
+        hosts.add(conn._con.hostno)
+
+        try:
+            result = await getattr(conn, method)(sql, *args)
+        except asyncio.TimeoutError:
+            raise
+        except CONNECTION_ERRORS:
+            self._recheck(conn._con.stat_host)
+            raise
+        finally:
+            await self.release(pool, conn)
+
+        self.observe_read(time.monotonic() - started)
+
+        return result
+
+    def observe_read(self, latency: float) -> None:
+        """ Add the latency of the read to the window of the hedge delay """
+
+        self.read_latencies.append(latency)
+
+        # The length stops growing once the window is full
+        self._hedge_reads += 1
+        if self._hedge_reads % self.hedge_refresh == 0:
+            self._hedge_delay = None
+
+    def hedge_delay(self) -> float:
+        """ Delay of the hedged request, None until enough samples """
+
+        if len(self.read_latencies) < self.hedge_min_samples:
+            return None
+
+        if self._hedge_delay is None:
+            latencies = sorted(self.read_latencies)
+            index = int(len(latencies) * self.hedge_percentile / 100)
+            self._hedge_delay = max(
+                latencies[min(index, len(latencies) - 1)],
+                self.hedge_min_delay,
+            )
+
+        return self._hedge_delay
+
+    def _has_replica(self, mode, exclude, max_lag=None) -> bool:
+        """ Whether there is another replica to hedge the read to """
+
+        modes = ('slave',) if mode == 'slave' else ('slave', 'slow')
+
+        if max_lag is not None:
+            modes = ('slave', 'slow')
+
+        return any(
+            stat_host['mode'] in modes
+            and stat_host['no'] not in exclude
+            and (
+                max_lag is None
+                or stat_host['lag'] is not None
+                and stat_host['lag'] <= max_lag
+            )
+            for stat_host in self.stat.values()
+        )
+
+    async def _hedged(self, method, sql, args, hosts, **opts):
+        tried = len(hosts)
+        delay = self.hedge_delay()
+        tasks = [asyncio.ensure_future(
+            self._execute(method, sql, args, hosts, **opts)
+        )]
+
+        try:
+            if delay is None:
+                return await tasks[0]
+
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+
+            # Until the first request takes a connection its host is not
+            # known, hedging then could hit the same replica
+            if done or len(hosts) == tried or not self._has_replica(
+                opts['mode'], hosts, opts['max_lag'],
             ):
-                self.check_is_running = True
-                await self._check()
-                self.check_task = asyncio.create_task(self._run_check())
+                return await tasks[0]
+
+            self.hedged += 1
+            tasks.append(asyncio.ensure_future(
+                self._execute(method, sql, args, hosts, **opts)
+            ))
+            pending, error = set(tasks), None
+
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED,
+                )
+
+                for task in done:
+                    if task.exception() is None:
+                        if task is tasks[1]:
+                            self.hedge_wins += 1
+                        return task.result()
+
+                    if error is None:
+                        error = task.exception()
+
+            raise error
+
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                    task.add_done_callback(self._forget)
+
+    @staticmethod
+    def _forget(task):
+        if not task.cancelled():
+            task.exception()
+
+    async def acquire(
+        self,
+        mode,
+        token=None,
+        max_lag=None,
+        priority=None,
+        exclude=(),
+    ):
+        """ Get connection from the pool
+
+        With the token only replicas that have replayed the session writes
+        are used, otherwise the connection is taken from the master.
+        With `max_lag` (seconds) any replica within the lag is used,
+        the master only when none of them qualifies.
+        With admission control the request first waits for the turn of its
+        `priority` class and fails with `ErrorOverload` when overloaded.
+        Hosts with the numbers from `exclude` are skipped
+        """
+
+        if self.loop is None or self.track_loop:
+            await self._loop_changed()
+
+        self.query_last_time = self.loop.time()
+
+        if not self.check_is_running or not self.scheduler.running:
+            await self._start_check()
+
+        if self.admission is None:
+            return await self._acquire(mode, token, max_lag, exclude)
+
+        ticket = await self.admission.acquire(
+            priority, timeout=remaining(self.pool_acquire_timeout),
+        )
+
         try:
-            stat_host = await self._seek_pool(mode)
+            pool, conn = await self._acquire(mode, token, max_lag, exclude)
+        except BaseException:
+            self.admission.release(ticket)
+            raise
+
+        conn._con.ticket = ticket
+        return pool, conn
+
+    async def _acquire(self, mode, token, max_lag, exclude=()):
+        """ Pick the host and take its connection """
+
+        min_lsn = token.get(self.name, self.shardno) if token else 0
+
+        try:
+            if max_lag is not None and mode != 'master':
+                stat_host = await self._seek_fresh_pool(
+                    max_lag, min_lsn, exclude,
+                )
+            else:
+                stat_host = await self._seek_pool(mode, min_lsn, exclude)
         except ErrorWrong:
-            self.check_last_time = 0
+            self._recheck()
             raise
 
+        if min_lsn and mode != 'master' and stat_host['mode'] == 'master':
+            caught_up = await self._catch_up(mode, min_lsn, exclude)
+            if caught_up is not None:
+                return caught_up
+
         try:
-            pool = stat_host['pool']
-            conn = await pool.acquire(timeout=self.pool_acquire_timeout)
-
-            realcon = conn._con
-            realcon.hostno = stat_host['no']
-            realcon.shardno = stat_host['shardno']
-            realcon.name = stat_host['db']
-            realcon.mode = stat_host['mode']
-
-            return pool, conn
-
-        except (
-            OSError,
-            ConnectionError,
-            asyncio.TimeoutError,
-            PostgresConnectionError,
-            InterfaceError,
-        ):
+            return await self._acquire_host(stat_host)
+
+        except asyncio.TimeoutError:
+            # The caller gave up, the host is not to blame
+            if expired():
+                raise
+
+            stat_host['metrics'].acquire_timeouts += 1
+
             if mode != 'master':
-                stat_host['mode'] = 'not_connected'
+                self._set_mode(stat_host, 'not_connected')
+
+            self._recheck(stat_host)
+
+            raise
+
+        except CONNECTION_ERRORS:
+            self._host_failed(stat_host)
 
-            self.check_last_time = 0
+            raise
+
+    async def _acquire_host(self, stat_host):
+        """ Take connection of the host within its current pool limit """
+
+        pool = stat_host['pool']
+        limiter = stat_host['limiter']
+        timeout = remaining(self.pool_acquire_timeout)
+        stat_host['inflight'] += 1
+        started = time.monotonic()
 
+        try:
+            # No coroutine or clock reads on the steady-state path
+            if limiter.try_acquire():
+                left = timeout
+            else:
+                await limiter.acquire(timeout=timeout)
+                left = max(timeout - (time.monotonic() - started), 0)
+
+            try:
+                conn = await pool.acquire(timeout=left)
+            except BaseException:
+                limiter.release()
+                raise
+
+        except BaseException:
+            stat_host['inflight'] -= 1
             raise
 
+        wait = time.monotonic() - started
+        stat_host['metrics'].acquire.observe(wait)
+        limiter.record(wait)
+        self._bind(conn, stat_host)
+
+        return pool, conn
+
+    @property
+    def autoscale(self) -> bool:
+        return self.pool_min_size < self.pool_max_size
+
+    @property
+    def check_at(self) -> float:
+        """ Time of the nearest probe or autoscaling of the hosts """
+
+        # Hosts being probed are due again once the probe ends
+        return min([
+            self.scale_at,
+            *(
+                stat_host['check_at']
+                for stat_host in self.stat.values()
+                if not stat_host['probing']
+            ),
+        ])
+
+    def resize(self, min_size: int = None, max_size: int = None) -> None:
+        """ Change the pool limits at runtime
+
+        Pools are not recreated: limits apply to new acquires, in-flight
+        queries keep their connections. The maximum is bounded by
+        `pool_max_capacity` the pools were created with. Connections left
+        above the limit are closed by the pool once idle for
+        `pool_idle_connection_ttl`
+        """
+
+        min_size = self.pool_min_size if min_size is None else min_size
+        max_size = self.pool_max_size if max_size is None else max_size
+
+        if not 1 <= min_size <= max_size <= self.pool_max_capacity:
+            raise ErrorInvalid(
+                f'Pool size {min_size}..{max_size}'
+                f' (capacity {self.pool_max_capacity})'
+            )
+
+        self.pool_min_size = min_size
+        self.pool_max_size = max_size
+
+        for stat_host in self.stat.values():
+            limiter = stat_host['limiter']
+            limiter.resize(min(max(limiter.limit, min_size), max_size))
+
+        if self.autoscale and self.check_is_running:
+            self.scale_at = min(
+                self.scale_at,
+                self.loop.time() + self.pool_autoscale_interval,
+            )
+            self.scheduler.wake()
+
+    def _autoscale(self) -> None:
+        """ Adjust pool limits of the hosts to the acquire wait
+
+        The limit grows by half while connections are awaited longer than
+        `pool_autoscale_wait` and shrinks by one when less than half of it
+        was used. The pool reuses the latest released connections, so
+        the ones above the limit stay idle and are closed by the pool
+        after `pool_idle_connection_ttl`
+        """
+
+        for stat_host in self.stat.values():
+            limiter = stat_host['limiter']
+            wait = limiter.waited / limiter.acquired if limiter.acquired else 0
+
+            if limiter.waiters or wait > self.pool_autoscale_wait:
+                limit = limiter.limit + max(limiter.limit // 2, 1)
+            elif limiter.peak * 2 < limiter.limit:
+                limit = limiter.limit - 1
+            else:
+                limit = limiter.limit
+
+            limit = min(max(limit, self.pool_min_size), self.pool_max_size)
+
+            if limit != limiter.limit:
+                limiter.resize(limit)
+
+            limiter.reset()
+
+    async def _start_check(self) -> None:
+        """ Start the health check unless a concurrent acquire did it """
+
+        async with self.lock:
+            if self.check_is_running and self.scheduler.running:
+                return
+
+            self.check_is_running = True
+            await detached(self._check())
+
+            if self.autoscale:
+                self.scale_at = self.loop.time() + self.pool_autoscale_interval
+
+            self.scheduler.add(self)
+
     async def close(self, *, force: bool = False) -> None:
         await self._loop_changed()
 
         async with self.lock:
             self.check_is_running = False
-
-            if self.check_task:
-                try:
-                    await self.check_task
-                    self.check_task = None
-                except Exception as exc:
-                    pass
+            self.scale_at = float('inf')
+            self.scheduler.discard(self)
 
             await asyncio.gather(
                 *(
@@ -268,31 +1235,99 @@ class PgShard:
                 return_exceptions=False,
             )
 
-    async def _run_check(self) -> None:
-        while self.check_is_running:
-            await self._check()
-            await asyncio.sleep(self.check_sleep)
-
     async def _check(self) -> None:
+        """ Probe the hosts which are due """
+
+        await asyncio.gather(
+            *(self._probe(hostno) for hostno in self._due()),
+            return_exceptions=True,
+        )
+
+    def _due(self) -> list:
+        """ Hosts to probe now
+
+        Healthy hosts of an idle shard are not probed, hosts that failed
+        are probed with exponential backoff
+        """
+
         t = self.loop.time()
 
-        if self.is_connected:
-            if t - self.check_last_time < self.check_interval:
-                return
+        if t >= self.scale_at:
+            self._autoscale()
+            self.scale_at = t + self.pool_autoscale_interval
 
-            if t - self.query_last_time > self.check_interval:
-                return
+        idle = (
+            self.is_connected
+            and t - self.query_last_time > self.check_interval
+        )
+        hostnos = []
 
-        await asyncio.gather(
-            *(
-                self._check_pool(hostno)
-                for hostno, _ in enumerate(self.dsn.hosts)
-            ),
-            return_exceptions=True,
+        for hostno, stat_host in self.stat.items():
+            if stat_host['probing'] or stat_host['check_at'] > t:
+                continue
+
+            if idle and stat_host['breaker'] == 'closed':
+                stat_host['check_at'] = t + self.check_interval
+                continue
+
+            hostnos.append(hostno)
+
+        return hostnos
+
+    async def _probe(self, hostno: int) -> None:
+        stat_host = self.stat[hostno]
+
+        if stat_host['breaker'] == 'open':
+            stat_host['breaker'] = 'half_open'
+
+        stat_host['probing'] = True
+        try:
+            await self._check_pool(hostno)
+        except Exception:
+            self._host_failed(stat_host)
+            raise
+        finally:
+            stat_host['probing'] = False
+
+        if stat_host['mode'] == 'not_connected':
+            self._host_failed(stat_host)
+            return
+
+        stat_host['failures'] = 0
+        stat_host['breaker'] = 'closed'
+        stat_host['check_at'] = self.loop.time() + self.check_interval
+
+    def _host_failed(self, stat_host) -> None:
+        """ Open the circuit breaker of the host
+
+        The host is not used until a probe succeeds, probes are retried
+        with exponential backoff and jitter
+        """
+
+        self._set_mode(stat_host, 'not_connected')
+        stat_host['failures'] += 1
+        stat_host['breaker'] = 'open'
+
+        backoff = min(
+            self.check_backoff * 2 ** (stat_host['failures'] - 1),
+            self.check_backoff_max,
+        )
+        stat_host['check_at'] = (
+            self.loop.time() + backoff * random.uniform(0.5, 1)
         )
 
-        if self.is_connected:
-            self.check_last_time = t
+        self.scheduler.wake()
+
+    def _recheck(self, stat_host=None) -> None:
+        """ Probe the hosts with closed breakers in the next round """
+
+        stat_hosts = self.stat.values() if stat_host is None else (stat_host,)
+
+        for stat_host_ in stat_hosts:
+            if stat_host_['breaker'] == 'closed':
+                stat_host_['check_at'] = 0
+
+        self.scheduler.wake()
 
     async def _check_pool(self, hostno: int) -> None:
         await self._loop_changed()
@@ -300,7 +1335,6 @@ class PgShard:
         stat_host = self.stat[hostno]
 
         pool = stat_host['pool']
-        mode = stat_host['mode']
 
         server_settings = {
             'enable_seqscan': 'off',
@@ -312,7 +1346,7 @@ class PgShard:
             try:
                 pool = await asyncpg.create_pool(
                     min_size=self.pool_min_size,
-                    max_size=self.pool_max_size,
+                    max_size=self.pool_max_capacity,
                     max_queries=self.pool_max_queries,
                     max_inactive_connection_lifetime=(
                         self.pool_idle_connection_ttl
@@ -327,6 +1361,8 @@ class PgShard:
                     OSError,
                     ConnectionError,
                     asyncio.TimeoutError,
+                    asyncpg.PostgresError,
+                    InterfaceError,
             ):
                 new_mode = 'not_connected'
 
@@ -337,6 +1373,9 @@ class PgShard:
                         CHECK_QUERY, timeout=5,
                     )
 
+                    stat_host['lsn'] = check_result['lsn']
+                    stat_host['lag'] = float(check_result['lag'])
+
                     if check_result['replica']:
                         if check_result['lag'] > self.slow_lag:
                             new_mode = 'slow'
@@ -355,24 +1394,65 @@ class PgShard:
                 new_mode = 'not_connected'
 
         stat_host['pool'] = pool
-        stat_host['mode'] = new_mode
         stat_host['inited'] = True
+        self._set_mode(stat_host, new_mode)
 
-        if new_mode == mode:
+    @staticmethod
+    def _set_mode(stat_host, mode: str) -> None:
+        if stat_host['mode'] == mode:
             return
 
-        if new_mode == 'not_connected':
-            return
+        stat_host['metrics'].transition(stat_host['mode'], mode)
+        stat_host['mode'] = mode
 
-    async def _seek_pool(self, mode):
+    def metrics(self) -> list:
+        """ Snapshot of the metrics of the hosts """
+
+        result = []
+
+        for stat_host in self.stat.values():
+            pool = stat_host['pool']
+
+            if isinstance(pool, Pool):
+                size = pool.get_size()
+                free = pool.get_idle_size()
+                max_size = pool.get_max_size()
+            else:
+                size, free, max_size = 0, 0, self.pool_max_size
+
+            result.append({
+                'db': self.name,
+                'shardno': self.shardno,
+                'host': stat_host['host'],
+                'port': stat_host['port'],
+                'mode': stat_host['mode'],
+                'breaker': stat_host['breaker'],
+                'pool': {
+                    'size': size,
+                    'free': free,
+                    'in_use': size - free,
+                    'limit': stat_host['limiter'].limit,
+                    'max_size': max_size,
+                },
+                'metrics': stat_host['metrics'].json(),
+            })
+
+        return result
+
+    async def _seek_pool(self, mode, min_lsn=0, exclude=()):
         candidates = []
 
         for stat_host in self.stat.values():
-            if stat_host['mode'] == mode:
-                candidates.append(stat_host)
+            if stat_host['mode'] != mode or stat_host['no'] in exclude:
+                continue
+
+            if mode != 'master' and stat_host['lsn'] < min_lsn:
+                continue
+
+            candidates.append(stat_host)
 
         if candidates:
-            return random.choice(candidates)
+            return self._choose(candidates)
 
         if mode == 'master':
             raise ErrorWrong(
@@ -380,12 +1460,134 @@ class PgShard:
             )
 
         if mode == 'slave':
-            return await self._seek_pool('master')
+            return await self._seek_pool('master', min_lsn, exclude)
 
         if mode == 'slow':
-            return await self._seek_pool('slave')
+            return await self._seek_pool('slave', min_lsn, exclude)
+
+        return await self._seek_pool('slow', min_lsn, exclude)
+
+    async def _seek_fresh_pool(self, max_lag, min_lsn=0, exclude=()):
+        candidates = []
+
+        for stat_host in self.stat.values():
+            if stat_host['mode'] not in ('slave', 'slow'):
+                continue
+
+            if stat_host['no'] in exclude:
+                continue
+
+            if stat_host['lag'] is None or stat_host['lag'] > max_lag:
+                continue
+
+            if stat_host['lsn'] < min_lsn:
+                continue
+
+            candidates.append(stat_host)
+
+        if candidates:
+            return self._choose(candidates)
+
+        return await self._seek_pool('master', exclude=exclude)
+
+    async def _catch_up(self, mode, min_lsn, exclude=()):
+        """ Recheck a replica that lagged behind the session at last probe
+
+        Returns the acquired connection if the replica has replayed the
+        position by now, otherwise None to fall back to the master
+        """
+
+        modes = ('slave',) if mode == 'slave' else ('slave', 'slow')
+        candidates = [
+            stat_host
+            for stat_host in self.stat.values()
+            if stat_host['mode'] in modes and stat_host['no'] not in exclude
+        ]
+
+        if not candidates:
+            return None
+
+        stat_host = self._choose(candidates)
+
+        try:
+            pool, conn = await self._acquire_host(stat_host)
+        except asyncio.TimeoutError:
+            return None
+        except CONNECTION_ERRORS:
+            self._host_failed(stat_host)
+            return None
 
-        return await self._seek_pool('slow')
+        try:
+            lsn = await conn.fetchval(REPLAY_LSN_QUERY)
+        except Exception:
+            await self.release(pool, conn)
+            raise
+
+        stat_host['lsn'] = max(stat_host['lsn'], lsn)
+
+        if lsn < min_lsn:
+            await self.release(pool, conn)
+            return None
+
+        return pool, conn
+
+    async def release(self, pool, conn) -> None:
+        """ Return connection to the pool """
+
+        stat_host = conn._con.stat_host
+
+        # Tickets are only taken with admission control
+        ticket = getattr(conn._con, 'ticket', None)
+        if ticket is not None:
+            conn._con.ticket = None
+
+        try:
+            await pool.release(conn)
+        finally:
+            if stat_host is not None:
+                stat_host['inflight'] -= 1
+                stat_host['limiter'].release()
+
+            if ticket is not None:
+                self.admission.release(ticket)
+
+    def _choose(self, candidates):
+        """ Pick the host according to the balancer of the shard
+
+        `p2c` compares two random hosts by in-flight acquires weighted by
+        the EWMA of their query latency and takes the less loaded one
+        """
+
+        if len(candidates) == 1:
+            return candidates[0]
+
+        if self.balancer == 'random':
+            return random.choice(candidates)
+
+        first, second = random.sample(candidates, 2)
+
+        if self._load(second) < self._load(first):
+            return second
+
+        return first
+
+    @staticmethod
+    def _load(stat_host):
+        latency = stat_host['latency']
+        if latency is None:
+            latency = 0
+
+        # Hosts without samples are compared by in-flight acquires only
+        return (stat_host['inflight'] + 1) * (latency + 0.001)
+
+    @staticmethod
+    def _bind(conn, stat_host):
+        realcon = conn._con
+        realcon.hostno = stat_host['no']
+        realcon.shardno = stat_host['shardno']
+        realcon.name = stat_host['db']
+        realcon.mode = stat_host['mode']
+        realcon.stat_host = stat_host
 
     async def _close_pool(self, hostno: int, *, force: bool = False) -> None:
         await self._loop_changed()
@@ -410,7 +1612,7 @@ class PgShard:
         if self.loop is None:
             self.loop = asyncio.get_event_loop()
 
-        if 'pytest' not in sys.modules:
+        if not self.track_loop:
             return False
 
         loop = asyncio.get_event_loop()
@@ -427,17 +1629,37 @@ class PgShard:
             stat_host['pool'] = None
             stat_host['mode'] = 'not_connected'
             stat_host['inited'] = False
-        self.check_task = None
+            stat_host['inflight'] = 0
+            stat_host['check_at'] = 0
+            stat_host['probing'] = False
+            stat_host['failures'] = 0
+            stat_host['breaker'] = 'closed'
+            stat_host['limiter'] = PoolLimiter(stat_host['limiter'].limit)
 
         return True
 
 
 class PgShards:
     shards: list
+    router = None
     _name = None
 
-    def __init__(self, dsnstrs, *, name=None, nshards=None, **opts):
+    def __init__(
+        self,
+        dsnstrs,
+        *,
+        name=None,
+        nshards=None,
+        router=None,
+        metric_suffix=None,
+        **opts,
+    ):
         self._name = name
+        self.router = router or JumpHashRouter()
+
+        if isinstance(metric_suffix, dict):
+            metric_suffix = os.environ.get(metric_suffix.get('env', ''))
+        self.metric_suffix = metric_suffix or ''
         shards = []
 
         for shardno, dsnstr in enumerate(dsnstrs):
@@ -461,62 +1683,259 @@ class PgShards:
             return self._name
         return self.shards[0].name
 
-    def __call__(self, *, shard=None, mode='master', key=None, eid=None):
+    def route(self, key, router=None):
+        """ Shard number for the key
+
+        The router spreads keys over `nshards` logical shards, which are
+        mapped onto the configured physical shards
+        """
+
+        if key is None:
+            return 0
+
+        if isinstance(key, (list, tuple)):
+            if not key or any(subkey is None for subkey in key):
+                return 0
+
+        router = router or self.router
+        return router(key, self.nshards) % len(self.shards)
+
+    def __call__(
+        self,
+        *,
+        shard=None,
+        mode='master',
+        key=None,
+        eid=None,
+        router=None,
+        token=None,
+        max_lag=None,
+        priority=None,
+    ):
+        shardo = self.shard(shard=shard, key=key, eid=eid, router=router)
+        return shardo(
+            mode=mode,
+            token=token,
+            max_lag=max_lag,
+            priority=priority,
+        )
+
+    def shard(self, *, shard=None, key=None, eid=None, router=None):
+        """ Shard by the number or by the key """
+
         if shard is None:
-            shard = 0
+            if key is None:
+                key = eid
+            shard = self.route(key, router)
 
         if shard < 0 or shard >= len(self.shards):
             raise ErrorWrong(f'Shard count {shard} (to {len(self.shards) - 1})')
 
-        shardo = self.shards[shard]
-        return shardo(mode=mode)
+        return self.shards[shard]
+
+    async def query(
+        self,
+        method,
+        sql,
+        *args,
+        shard=None,
+        key=None,
+        eid=None,
+        router=None,
+        **opts,
+    ):
+        """ Run the statement on the shard, see `PgShard.query` """
+
+        shardo = self.shard(shard=shard, key=key, eid=eid, router=router)
+        return await shardo.query(method, sql, *args, **opts)
 
     async def close(self):
         for shard in self.shards:
             await shard.close()
 
+    def metrics(self) -> list:
+        """ Snapshot of the metrics of the hosts of all shards """
+
+        return [
+            host
+            for shard in self.shards
+            for host in shard.metrics()
+        ]
+
     @property
     def nshards(self):
         return self._nshards
 
 class Dbh:
     default_database: str
+    scheduler: HealthScheduler
+    configs: dict
+    databases: dict
 
     def __init__(self):
         self.default_database = PG_DEFAULT_DB
+        self.scheduler = HealthScheduler()
+        self.configs = {}
+        self.databases = {}
 
         for dbname, dbcfg in DBS.items():
-            shards = list(filter(lambda x: x, DBS['main']['shards']))
+            self.configure(dbname, **dbcfg)
+
+    def __getattr__(self, name):
+        if name in self.__dict__.get('configs', {}):
+            return self.get(name)
+
+        raise AttributeError(name)
+
+    def configure(self, name: str, **dbcfg) -> None:
+        """ Declare the database or update its config
+
+        The shards and their pools are created on the first use
+        of the database
+        """
+
+        dbcfg = {**self.configs.get(name, {}), **dbcfg}
+
+        if name in self.databases and dbcfg != self.configs[name]:
+            raise ErrorWrong(f'Database is already in use: {name}')
+
+        self.configs[name] = dbcfg
+
+    def __call__(
+        self,
+        *,
+        db=None,
+        mode='master',
+        shard=None,
+        key=None,
+        router=None,
+        token=None,
+        max_lag=None,
+        priority=None,
+    ):
+        shards = self.get(db)
+        return shards(
+            mode=mode,
+            shard=shard,
+            key=key,
+            router=router,
+            token=token,
+            max_lag=max_lag,
+            priority=priority,
+        )
 
-            if not shards:
-                continue
+    async def query(self, method, sql, *args, db=None, **opts):
+        """ Run the statement in the database
+
+        `method` is the connection method (`fetch`, `fetchrow`, ...),
+        the options are the same as for the connection context,
+        `hedge` for reads from replicas and `singleflight`
+        """
+
+        return await self.get(db).query(method, sql, *args, **opts)
+
+    def session(
+        self,
+        *,
+        db=None,
+        mode='master',
+        transaction=False,
+        isolation=None,
+        priority=None,
+    ) -> Session:
+        """ Scope pinning one connection per shard of the database """
+
+        return Session(
+            db or self.default_database,
+            mode=mode,
+            transaction=transaction,
+            isolation=isolation,
+            priority=priority,
+        )
 
-            setattr(
-                self,
-                dbname,
-                PgShards(shards, name=dbname, **dbcfg)
-            )
+    def get(self, db=None) -> PgShards:
+        """ Shards of the database """
 
-    def __call__( self, *, db=None, mode='master', shard=None):
         if not db:
             db = self.default_database
 
-        if not hasattr(self, db):
+        shards = self.databases.get(db)
+        if shards is not None:
+            return shards
+
+        dbcfg = dict(self.configs.get(db, {}))
+        dsnstrs = list(filter(lambda x: x, dbcfg.pop('shards', None) or []))
+
+        if not dsnstrs:
             raise ValueError(f'Unknown database: {db}')
 
-        shards = getattr(self, db)
-        return shards(mode=mode, shard=shard)
+        shards = PgShards(
+            dsnstrs,
+            name=db,
+            scheduler=self.scheduler,
+            **dbcfg,
+        )
+        self.databases[db] = shards
+
+        return shards
+
+    def each(
+        self,
+        *,
+        db=None,
+        mode='master',
+        token=None,
+        max_lag=None,
+        priority=None,
+    ):
+        """ Connection contexts of every shard of the database """
+
+        shards = self.get(db)
+        return [
+            shards(
+                mode=mode,
+                shard=shardno,
+                token=token,
+                max_lag=max_lag,
+                priority=priority,
+            )
+            for shardno, _ in enumerate(shards.shards)
+        ]
+
+    def route(self, db=None, key=None, router=None):
+        """ Shard number of the key in the database """
+
+        return self.get(db).route(key, router)
 
     def nshards(self, db: str):
-        if not hasattr(self, db):
-            raise ValueError(f'Unknown database: {db}')
+        return self.get(db).nshards
+
+    def metrics(self) -> list:
+        """ Snapshot of pool and query metrics of every host """
 
-        dbshards = getattr(self, db)
-        return dbshards.nshards
+        return [
+            host
+            for shards in self.databases.values()
+            for host in shards.metrics()
+        ]
+
+    def metrics_text(self) -> str:
+        """ Metrics in the Prometheus text format """
+
+        snapshots = {}
+
+        for shards in self.databases.values():
+            snapshots.setdefault(shards.metric_suffix, []).extend(
+                shards.metrics()
+            )
+
+        return ''.join(
+            render_prometheus(snapshot, suffix)
+            for suffix, snapshot in snapshots.items()
+        )
 
     async def close(self):
-        for dbname in DBS.keys():
-            shards = getattr(self, dbname)
+        for shards in self.databases.values():
             await shards.close()
 
 
@@ -0,0 +1,88 @@
+"""
+Deadlines of the requests
+"""
+
+import asyncio
+import contextvars
+import time
+
+
+DEADLINE = contextvars.ContextVar('consql_deadline', default=None)
+
+
+class Deadline:
+    """ Scope limiting the time of the queries inside it
+
+    Nested scopes can only shorten the outer deadline
+    """
+
+    __slots__ = ('seconds', '_token')
+
+    def __init__(self, seconds: float = None):
+        self.seconds = seconds
+        self._token = None
+
+    def __enter__(self):
+        at = DEADLINE.get()
+
+        if self.seconds is not None:
+            mine = time.monotonic() + self.seconds
+            if at is None or mine < at:
+                at = mine
+
+        self._token = DEADLINE.set(at)
+        return self
+
+    def __exit__(self, extype, extvalue, extraceback):
+        DEADLINE.reset(self._token)
+        self._token = None
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, extype, extvalue, extraceback):
+        self.__exit__(extype, extvalue, extraceback)
+
+
+def deadline(seconds: float = None) -> Deadline:
+    """ Limit the time of the queries in the scope
+
+    `async with consql.deadline(0.2):` shrinks the acquire and statement
+    timeouts of every query inside it to the time left
+    """
+
+    return Deadline(seconds)
+
+def expired() -> bool:
+    """ Whether the deadline of the current scope has passed """
+
+    at = DEADLINE.get()
+    return at is not None and at <= time.monotonic()
+
+def remaining(timeout: float = None) -> float:
+    """ Timeout shrunk to the deadline of the current scope
+
+    Raises `asyncio.TimeoutError` when the deadline has passed
+    """
+
+    at = DEADLINE.get()
+    if at is None:
+        return timeout
+
+    left = at - time.monotonic()
+    if left <= 0:
+        raise asyncio.TimeoutError()
+
+    if timeout is None:
+        return left
+
+    return min(timeout, left)
+
+def detached(coro) -> asyncio.Task:
+    """ Task of the coroutine outside the scopes of the caller
+
+    Background work must not inherit the deadline, the session or other
+    context of the request which happened to start it
+    """
+
+    return contextvars.Context().run(asyncio.ensure_future, coro)
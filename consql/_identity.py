@@ -0,0 +1,91 @@
+"""
+Identity map of the instances
+"""
+
+import contextvars
+
+
+IDENTITY = contextvars.ContextVar('consql_identity', default=None)
+
+
+class IdentityMap:
+    """ Instances loaded in the scope by their models and primary keys
+
+    Inside the scope repeated lookups of a row by the primary key return
+    the same instance without a query
+    """
+
+    __slots__ = ('instances', '_token')
+
+    def __init__(self):
+        self.instances = {}
+        self._token = None
+
+    def __len__(self):
+        return len(self.instances)
+
+    @staticmethod
+    def _name(model, key):
+        key = tuple(key)
+        if any(value is None for value in key):
+            return None
+        return model, key
+
+    def get(self, model, key):
+        name = self._name(model, key)
+        if name is None:
+            return None
+        return self.instances.get(name)
+
+    def add(self, instance):
+        """ Put the instance in place of the known one """
+
+        name = self._name(type(instance), instance.get_key())
+        if name is not None:
+            self.instances[name] = instance
+        return instance
+
+    def merge(self, instance):
+        """ Known instance of the row or the added one """
+
+        name = self._name(type(instance), instance.get_key())
+        if name is None:
+            return instance
+        return self.instances.setdefault(name, instance)
+
+    def discard(self, model, key):
+        name = self._name(model, key)
+        if name is not None:
+            self.instances.pop(name, None)
+
+    def clear(self, model=None):
+        if model is None:
+            self.instances.clear()
+            return
+
+        for name in [name for name in self.instances if name[0] is model]:
+            del self.instances[name]
+
+    def __enter__(self):
+        self._token = IDENTITY.set(self)
+        return self
+
+    def __exit__(self, extype, extvalue, extraceback):
+        IDENTITY.reset(self._token)
+        self._token = None
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, extype, extvalue, extraceback):
+        self.__exit__(extype, extvalue, extraceback)
+
+
+def identity_map() -> IdentityMap:
+    """ Scope of the identity map, e.g. one per request
+
+    `async with consql.identity_map():` makes `get` by the primary key
+    return the instances already loaded, saved or fetched in the scope
+    """
+
+    return IdentityMap()
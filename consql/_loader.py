@@ -0,0 +1,131 @@
+"""
+Batching of the lookups by keys
+"""
+
+import asyncio
+import copy
+
+from asyncpg import DataError
+
+from ._deadline import detached, remaining
+from .errors import ErrorInvalid
+
+
+LOADERS = {}
+
+
+class Loader:
+    """ Lookups by keys of one model and database sent together
+
+    Keys requested in the same loop iteration (or within `window`
+    seconds) are fetched by one `get_many`, callers of the same key get
+    their own instances of the row
+    """
+
+    def __init__(self, model, db, window=0, name=None):
+        self.model = model
+        self.db = db
+        self.window = window
+        self.name = name
+        self.pending = {}
+
+    async def load(self, key):
+        """ Instance by the key or `None` """
+
+        future = self.pending.get(key)
+
+        if future is None:
+            loop = asyncio.get_running_loop()
+
+            if not self.pending:
+                if self.window:
+                    loop.call_later(self.window, self._dispatch)
+                else:
+                    loop.call_soon(self._dispatch)
+
+            future = self.pending[key] = loop.create_future()
+
+        # A cancelled caller must not cancel the others, the batch is out
+        # of the caller's deadline, so the wait is limited by it
+        found = await asyncio.wait_for(asyncio.shield(future), remaining())
+        if found is None:
+            return None
+
+        row, shard = found
+        instance = self.model(copy.deepcopy(row))
+        if shard is not None:
+            instance.actual_shard = shard
+        return instance
+
+    def _dispatch(self):
+        pending, self.pending = self.pending, {}
+
+        # The next keys are collected by a new loader
+        if LOADERS.get(self.name) is self:
+            del LOADERS[self.name]
+
+        # Callers from different scopes share the batch
+        detached(self._fetch(pending))
+
+    async def _fetch(self, pending):
+        try:
+            data = await self.model.get_many(list(pending), db=self.db)
+
+        except asyncio.CancelledError:
+            for future in pending.values():
+                future.cancel()
+            raise
+
+        except Exception as e:  # pylint: disable=broad-except
+            if len(pending) > 1 and isinstance(e, (DataError, ErrorInvalid)):
+                # One wrong key must not fail the others, failures of the
+                # database are the same for all keys
+                await asyncio.gather(*(
+                    self._fetch({key: future})
+                    for key, future in pending.items()
+                ))
+                return
+
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for key, future in pending.items():
+            if future.done():
+                continue
+
+            instance = data.get(key)
+            if instance is None:
+                future.set_result(None)
+                continue
+
+            future.set_result((
+                {
+                    name: dict(value) if isinstance(value, dict) else value
+                    for name, value in instance.items('all')
+                },
+                getattr(instance, 'actual_shard', None),
+            ))
+
+
+def loader(model, db, window=0):
+    """ Loader of the model for the database options
+
+    Returns `None` when the options can't identify the loader
+    """
+
+    try:
+        name = (
+            model,
+            tuple(sorted(db.items(), key=lambda item: item[0])),
+            window,
+        )
+        hash(name)
+    except TypeError:
+        return None
+
+    if name not in LOADERS:
+        LOADERS[name] = Loader(model, db, window, name)
+
+    return LOADERS[name]
@@ -0,0 +1,188 @@
+"""
+Pool and query metrics
+"""
+
+import bisect
+
+
+BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+PREFIX = 'consql_'
+HELP = {
+    'pool_acquire_seconds': 'Time waiting for a connection from the pool',
+    'query_seconds': 'Query execution time',
+    'pool_size': 'Open connections of the pool',
+    'pool_free': 'Idle connections of the pool',
+    'pool_in_use': 'Connections acquired from the pool',
+    'pool_limit': 'Current limit of connections of the pool',
+    'pool_max_size': 'Maximum size of the pool',
+    'host_mode': 'Current mode of the host',
+    'acquire_timeouts_total': 'Timeouts waiting for a pool connection',
+    'query_timeouts_total': 'Queries cancelled by timeout',
+    'mode_transitions_total': 'Changes of the host mode',
+}
+
+
+class Histogram:
+    """ Cumulative histogram with fixed buckets """
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def json(self):
+        total = 0
+        buckets = []
+
+        for le, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            buckets.append((le, total))
+
+        return {
+            'buckets': buckets,
+            'sum': self.sum,
+            'count': self.count,
+        }
+
+
+class HostMetrics:
+    """ Counters and histograms of one host """
+
+    def __init__(self):
+        self.acquire = Histogram()
+        self.query = Histogram()
+        self.acquire_timeouts = 0
+        self.query_timeouts = 0
+        self.transitions = {}
+
+    def transition(self, old_mode: str, new_mode: str) -> None:
+        key = (old_mode, new_mode)
+        self.transitions[key] = self.transitions.get(key, 0) + 1
+
+    def json(self):
+        return {
+            'pool_acquire_seconds': self.acquire.json(),
+            'query_seconds': self.query.json(),
+            'acquire_timeouts': self.acquire_timeouts,
+            'query_timeouts': self.query_timeouts,
+            'mode_transitions': [
+                {'from': old_mode, 'to': new_mode, 'count': count}
+                for (old_mode, new_mode), count in self.transitions.items()
+            ],
+        }
+
+
+def _labels(**labels):
+    data = ','.join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace('\\', '\\\\').replace('"', '\\"'),
+        )
+        for name, value in labels.items()
+    )
+    return '{' + data + '}'
+
+def render_prometheus(snapshot: list, suffix: str = None) -> str:
+    """ Metrics snapshot in the Prometheus text format """
+
+    samples = {}
+
+    def add(name, labels, value, kind):
+        metric = samples.setdefault(name, (kind, []))
+        metric[1].append((labels, value))
+
+    for host in snapshot:
+        labels = {
+            'db': host['db'],
+            'shard': host['shardno'],
+            'host': host['host'],
+            'port': host['port'],
+        }
+        pool = host['pool']
+
+        for name in ('size', 'free', 'in_use', 'limit', 'max_size'):
+            add(f'pool_{name}', _labels(**labels), pool[name], 'gauge')
+
+        add(
+            'host_mode',
+            _labels(**labels, mode=host['mode']),
+            1,
+            'gauge',
+        )
+
+        metrics = host['metrics']
+        add(
+            'acquire_timeouts_total',
+            _labels(**labels),
+            metrics['acquire_timeouts'],
+            'counter',
+        )
+        add(
+            'query_timeouts_total',
+            _labels(**labels),
+            metrics['query_timeouts'],
+            'counter',
+        )
+
+        for transition in metrics['mode_transitions']:
+            add(
+                'mode_transitions_total',
+                _labels(
+                    **labels,
+                    **{'from': transition['from'], 'to': transition['to']},
+                ),
+                transition['count'],
+                'counter',
+            )
+
+        for name in ('pool_acquire_seconds', 'query_seconds'):
+            histogram = metrics[name]
+
+            for le, count in histogram['buckets']:
+                add(
+                    name,
+                    ('_bucket', _labels(**labels, le=le)),
+                    count,
+                    'histogram',
+                )
+            add(
+                name,
+                ('_sum', _labels(**labels)),
+                histogram['sum'],
+                'histogram',
+            )
+            add(
+                name,
+                ('_count', _labels(**labels)),
+                histogram['count'],
+                'histogram',
+            )
+
+    suffix = f'_{suffix}' if suffix else ''
+    lines = []
+
+    for name, (kind, values) in samples.items():
+        full_name = PREFIX + name + suffix
+        lines.append(f'# HELP {full_name} {HELP[name]}')
+        lines.append(f'# TYPE {full_name} {kind}')
+
+        for labels, value in values:
+            if isinstance(labels, tuple):
+                sample_suffix, labels = labels
+            else:
+                sample_suffix = ''
+
+            lines.append(f'{full_name}{sample_suffix}{labels} {value}')
+
+    return '\n'.join(lines) + '\n'
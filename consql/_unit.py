@@ -0,0 +1,186 @@
+"""
+Unit of work
+"""
+
+from . import _json as json
+from ._cache import invalidate
+from ._db import dbh
+from ._identity import IDENTITY
+from ._sql import sqlt
+
+
+MAX_ARGS = 32767
+
+
+def hydrate(conflict, rows, data):
+    """ Update the instances with the returned rows
+
+    Rows are matched by the conflict key, rows with keys generated by the
+    database in the order of insertion. `rows` are pairs of the key
+    values and the instance
+    """
+
+    known = {}
+    generated = []
+
+    for key, instance in rows:
+        if all(value is not None for value in key):
+            known[json.dumps(key)] = instance
+        else:
+            generated.append(instance)
+
+    generated = iter(generated)
+    identity = IDENTITY.get()
+
+    for row in data:
+        key = json.dumps([row[name] for name in conflict])
+        instance = known.pop(key, None)
+
+        if instance is None:
+            instance = next(generated, None)
+
+        if instance is None:
+            continue
+
+        for name, value in row.items():
+            if name in instance.meta.fields:
+                setattr(instance, name, value)
+
+        instance.rehashed('-clean')
+
+        if identity is not None:
+            identity.add(instance)
+
+        invalidate(instance)
+
+    if known or next(generated, None) is not None:
+        raise Exception('Save exception')
+
+
+class UnitOfWork:
+    """ Instances saved together on flush
+
+    Instances are grouped by the model, the shard, the inserted columns
+    and the changed ones, each group is written by one multi-row upsert
+    with the semantics of `save`
+    """
+
+    batch_size = 1000
+
+    def __init__(self, db=None, **kw):
+        self.db = db
+        self.kw = kw
+        self.instances = []
+        self._added = set()
+
+    def __len__(self):
+        return len(self.instances)
+
+    def add(self, *instances):
+        """ Schedule instances for saving """
+
+        for instance in instances:
+            if id(instance) not in self._added:
+                self._added.add(id(instance))
+                self.instances.append(instance)
+
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, extype, extvalue, extraceback):
+        if extype is None:
+            await self.flush()
+
+    def _groups(self, instances):
+        groups = {}
+        rounds = {}
+
+        for instance in instances:
+            cls = type(instance)
+            table = cls.meta.table
+            instance.mark_extra()
+
+            db = cls.route_db(cls.get_db(self.db), instance.get_key())
+            conflict = table.conflict_key or table.pkey
+            key = [getattr(instance, name) for name in conflict]
+
+            # The same row can be updated only once per statement
+            if all(value is not None for value in key):
+                row = (cls, table.name, db.get('shard'), json.dumps(key))
+                rounds[row] = rounds.get(row, -1) + 1
+                stage = rounds[row]
+            else:
+                stage = 0
+
+            group = (
+                stage,
+                cls,
+                tuple(sorted(db.items(), key=lambda item: item[0])),
+                tuple(name for name, _ in instance.items('new')),
+                tuple(name for name, _ in instance.items('rehashed')),
+            )
+            groups.setdefault(group, (db, []))[1].append((key, instance))
+
+        for (_, cls, _, columns, rehashed), (db, rows) in sorted(
+            groups.items(), key=lambda group: group[0][0],
+        ):
+            extras = [
+                name for name in rehashed
+                if 'db_extra' in cls.meta.fields[name].tags
+            ]
+            # Parameters per row: a value per column, the key and the
+            # changed and deleted keys of each extra
+            width = len(columns) + 1 + 2 * len(extras)
+            size = max(min(self.batch_size, MAX_ARGS // width), 1)
+
+            for i in range(0, len(rows), size):
+                yield cls, db, columns, rehashed, extras, rows[i:i + size]
+
+    async def flush(self):
+        """ Write the scheduled instances and clear the unit
+
+        Returns the saved instances updated with the returned rows
+        """
+
+        instances, self.instances = self.instances, []
+        self._added = set()
+        saved = set()
+
+        try:
+            for (
+                cls, db, columns, rehashed, extras, rows,
+            ) in self._groups(instances):
+                table = cls.meta.table
+                conflict = table.conflict_key or table.pkey
+
+                sql, args = sqlt('flush.sqlt', {
+                    **self.kw,
+                    'rows': [instance for _, instance in rows],
+                    'keys': [key for key, _ in rows],
+                    'columns': columns,
+                    'rehashed': rehashed,
+                    'extras': extras,
+                    'conflict': conflict,
+                    'table': table,
+                    'sqlbase': cls.sqlbase(),
+                    'shard': db.get('shard'),
+                })
+
+                async with cls._deadline_for('save'):
+                    data = await dbh.query('fetch', sql, *args, **db)
+
+                hydrate(conflict, rows, data)
+                saved.update(id(instance) for _, instance in rows)
+
+        except BaseException:
+            # Unsaved instances are kept for the next flush
+            pending, self.instances, self._added = self.instances, [], set()
+            self.add(*(
+                instance for instance in instances
+                if id(instance) not in saved
+            ), *pending)
+            raise
+
+        return instances
@@ -75,3 +75,9 @@ class ErrorUnsaved(BaseError):
 class ErrorRequest(BaseError):
     """ Data request """
     code = 18
+
+class ErrorOverload(ErrorBusy):
+    """ Overloaded
+    Rejected by admission control
+    """
+    code = 19
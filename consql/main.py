@@ -2,17 +2,36 @@
 The layer for initializing the database
 """
 
-# from ._db import get_db
+from ._db import dbh
 from .model import BaseModel
 
 
-def make_base(host, name, login=None, password=None):
-    """ Declare the base class of the model """
+def make_base(host, name, login=None, password=None, **opts):
+    """ Declare the base class of the model
+
+    The connection arguments and pool options (`pool_min_size`,
+    `pool_max_size`, ...) configure the database `name`, its pools
+    are opened on the first query
+    """
+
+    if host:
+        dbh.configure(
+            name,
+            shards=[{
+                'host': host,
+                'dbname': name,
+                'user': login,
+                'password': password,
+            }],
+            **opts,
+        )
+
+    elif opts:
+        dbh.configure(name, **opts)
 
     class Base(BaseModel):
         """ Base model with the initialized database """
 
-        # _db = get_db(host, name, login, password)
         database = name
 
         @property
@@ -1,20 +1,35 @@
 import os
 import os.path
+import asyncio
 import copy
+import heapq
+import itertools
 import re
 import time
 import base64
 import hashlib
 from abc import abstractmethod
 
+from asyncpg.protocol import NO_TIMEOUT
+
 from . import _json as json
-from ._db import dbh
+from ._cache import (
+    RESULTS, cache_of, expire, expire_results, forget, invalidate,
+)
+from ._db import dbh, SESSION
+from ._deadline import deadline, remaining
+from ._identity import IDENTITY
+from ._loader import loader
 from ._sql import sqlt
+from ._unit import hydrate
 from .errors import ErrorInvalid, ErrorWrong, ErrorRequest
 
 
 TOKEN = ''
 CURSOR_LIMIT = 1000
+COLUMNS = {}
+# Options choosing the replica of the request, not the rows
+REPLICA_OPTIONS = ('token', 'max_lag', 'hedge')
 
 
 def enum(data):
@@ -513,6 +528,7 @@ class Cursor(Base):
     time = Attribute(types=int, required=True, default=lambda: int(time.time()))
     limit = Attribute(types=int)
     serial = Attribute(types=str, coerce=str)
+    serials = Attribute(types=dict, default=lambda: {})
     direction = Attribute(types=str, required=True, default='DESC')
 
     def __init__(self, row=None, **kw):
@@ -612,6 +628,127 @@ class BaseModel(Base):
 
         return data
 
+    @classmethod
+    def session(cls, mode='master', transaction=False, **kw):
+        """ Scope pinning one connection for all queries inside it
+
+        `async with Base.session(transaction=True):` runs the model calls
+        of the database in one transaction and without pool round trips
+        """
+
+        return dbh.session(
+            db=cls.database if isinstance(cls.database, str) else None,
+            mode=mode,
+            transaction=transaction,
+            **kw,
+        )
+
+    @classmethod
+    def get_read_db(cls, db=None, max_lag=None, hedge=None):
+        """ Database options for reading
+
+        Reads with a session token go to replicas that have replayed it,
+        reads with `max_lag` (seconds) to replicas lagging no more than it.
+        `hedge` turns hedged reads from replicas on or off
+        """
+
+        data = cls.get_db(db)
+
+        if max_lag is not None:
+            data['max_lag'] = max_lag
+
+        if hedge is not None:
+            data['hedge'] = hedge
+
+        if 'mode' not in data and (
+            data.get('token') is not None
+            or data.get('max_lag') is not None
+        ):
+            data['mode'] = 'slave'
+
+        return data
+
+    @classmethod
+    def coerce_key(cls, key, key_def=None):
+        """ Values of the key coerced by the attributes of its fields
+
+        Keys are hashed with their types, so `'5'` and `5` would be routed
+        to different shards
+        """
+
+        if key_def is None:
+            key_def = cls.meta.table.pkey
+
+        result = []
+
+        for name, value in zip(key_def, key):
+            field = cls.meta.fields.get(name)
+
+            if value is not None and field is not None and (
+                field.always or not field._check(value)
+            ):
+                try:
+                    value = field.coerce(value)
+                except ErrorRequest:
+                    pass
+                except (TypeError, ValueError) as e:
+                    raise ErrorInvalid(name) from e
+
+            result.append(value)
+
+        return result
+
+    @classmethod
+    def route_db(cls, db, key):
+        """ Choose the shard by the primary key unless it is specified
+
+        Keys generated by the database (e.g. SERIAL) are unknown before
+        the insert, so sharded tables need keys generated by the client,
+        otherwise `ErrorWrong` is raised
+        """
+
+        if db.get('shard') is not None or key is None:
+            return db
+
+        if isinstance(key, (list, tuple)) and (
+            not key or any(subkey is None for subkey in key)
+        ):
+            # The row would be written to the first shard and looked for
+            # by the hash of the key it gets
+            if len(dbh.get(db.get('db')).shards) > 1:
+                raise ErrorWrong(
+                    f'Key of {cls.meta.table.name} generated by the database'
+                )
+            return db
+
+        return {
+            **db,
+            'shard': dbh.route(db.get('db'), key, cls.meta.table.router),
+        }
+
+    @classmethod
+    def _deadline_for(cls, *names):
+        """ Deadline of the query by the first configured name
+
+        Timeouts are set per template or method in the `timeouts` option
+        of the model, e.g. `timeouts={'get': 0.5, 'pager': 2}`
+        """
+
+        timeouts = getattr(cls.meta, 'timeouts', None) or {}
+
+        for name in names:
+            if name in timeouts:
+                return deadline(timeouts[name])
+
+        return deadline()
+
+    @classmethod
+    def cache_stats(cls):
+        """ Counters of the cache of the model or `None` """
+
+        cache = cache_of(cls)
+        return cache.json() if cache is not None else None
+
     @classmethod
     def sqlbase(cls):
         paths = ['model']
@@ -629,8 +766,8 @@ class BaseModel(Base):
             subpath += '.sqlt'
         return os.path.join(cls.sqlbase(), subpath)
 
-    async def save(self, db=None, by='id', **kw):
-        db = self.get_db(db)
+    def mark_extra(self):
+        """ Mark extra fields with changed keys as changed """
 
         for k, v in self.meta.fields.items():
             if 'db_extra' in v.tags:
@@ -640,6 +777,10 @@ class BaseModel(Base):
                     if value.rehashed():
                         self.rehashed(name=True)
 
+    async def save(self, db=None, by='id', **kw):
+        db = self.route_db(self.get_db(db), self.get_key())
+        self.mark_extra()
+
         sql, args = sqlt('save.sqlt', {
             **kw,
             'key_def': (by,) if isinstance(by, str) else by,
@@ -650,8 +791,8 @@ class BaseModel(Base):
             'shard': db.get('shard'),
         })
 
-        async with dbh(**db) as conn:
-            data = await conn.fetchrow(sql, *args)
+        async with self._deadline_for('save'):
+            data = await dbh.query('fetchrow', sql, *args, **db)
 
         if not data:
             raise Exception('Save exception')
@@ -663,12 +804,469 @@ class BaseModel(Base):
             setattr(self, k, v)
 
         self.rehashed('-clean')
+
+        identity = IDENTITY.get()
+        if identity is not None:
+            identity.add(self)
+
+        invalidate(self)
         return self
 
+    @classmethod
+    async def columns(cls, db=None) -> dict:
+        """ Columns of the table from the catalog: type and default
+
+        Cached per database and table
+        """
+
+        db = cls.get_db(db)
+        table = cls.meta.table
+        key = (db.get('db'), table.schema, table.name)
+
+        if key not in COLUMNS:
+            relation = f'"{table.name}"'
+            if table.schema:
+                relation = f'"{table.schema}".{relation}'
+
+            sql, args = sqlt('columns.sqlt', {'relation': relation})
+            rows = await dbh.query('fetch', sql, *args, db=db.get('db'))
+            COLUMNS[key] = {row['name']: dict(row) for row in rows}
+
+        return COLUMNS[key]
+
+    @classmethod
+    async def save_many(
+        cls,
+        instances,
+        db=None,
+        chunk_size=5000,
+        update=None,
+        **kw,
+    ):
+        """ Upsert the instances with one statement per chunk
+
+        Values are sent as arrays per column and unnested on the server.
+        Instances are grouped by their changed columns, on conflict those
+        (or the ones from `update`) are replaced with the new values and
+        extra fields are merged like in `save`
+        """
+
+        instances = list(instances)
+        if not instances:
+            return instances
+
+        table = cls.meta.table
+        conflict = table.conflict_key or table.pkey
+        catalog = await cls.columns(db)
+        columns = cls._column_specs(catalog)
+
+        groups = {}
+        stages = {}
+
+        for instance in instances:
+            instance.mark_extra()
+            data = cls.route_db(cls.get_db(db), instance.get_key())
+            key = [getattr(instance, name) for name in conflict]
+            shard = data.get('shard')
+
+            # The same row can be updated only once per statement
+            stage = 0
+            if all(value is not None for value in key):
+                row = (shard, json.dumps(key))
+                stage = stages[row] = stages.get(row, -1) + 1
+
+            if update is None:
+                changed = frozenset(
+                    name for name, _ in instance.items('rehashed')
+                )
+            else:
+                changed = frozenset(update)
+
+            groups.setdefault(
+                (stage, shard, tuple(sorted(changed))), (data, []),
+            )[1].append((key, instance))
+
+        for (_, _, changed), (data, rows) in sorted(
+            groups.items(),
+            key=lambda group: (group[0][0], group[0][1] or 0, group[0][2]),
+        ):
+            names = [
+                column['name'] for column in columns
+                if column['name'] in changed
+                and column['name'] not in conflict
+            ]
+            extras = [
+                column['name'] for column in columns
+                if column['extra'] and column['name'] in names
+            ]
+
+            for i in range(0, len(rows), chunk_size):
+                chunk = rows[i:i + chunk_size]
+                values = [
+                    [
+                        cls._column_value(column, instance)
+                        for _, instance in chunk
+                    ]
+                    for column in columns
+                ]
+
+                sql, args = sqlt('save_many.sqlt', {
+                    **kw,
+                    'table': table,
+                    'fields': cls.meta.fields,
+                    'columns': columns,
+                    'values': values,
+                    'conflict': conflict,
+                    'update': names,
+                    'extras': extras,
+                    'extra_keys': [json.dumps(key) for key, _ in chunk],
+                    'extra_values': [
+                        (
+                            [
+                                None if value is None
+                                else json.dumps(value.updated_dict)
+                                for value in (
+                                    getattr(instance, name)
+                                    for _, instance in chunk
+                                )
+                            ],
+                            [
+                                None if value is None
+                                else json.dumps(value.deleted_keys)
+                                for value in (
+                                    getattr(instance, name)
+                                    for _, instance in chunk
+                                )
+                            ],
+                        )
+                        for name in extras
+                    ],
+                    'sqlbase': cls.sqlbase(),
+                    'shard': data.get('shard'),
+                })
+
+                async with cls._deadline_for('save_many', 'save'):
+                    result = await dbh.query('fetch', sql, *args, **data)
+
+                hydrate(conflict, chunk, result)
+
+        return instances
+
+    @classmethod
+    def _column_specs(cls, catalog, names=None):
+        """ Columns of the model fields existing in the table """
+
+        table = cls.meta.table
+        columns = []
+
+        for name, field in cls.meta.fields.items():
+            if name not in catalog or names is not None and name not in names:
+                continue
+
+            column = catalog[name]
+            json_value = (
+                'db_json' in field.tags
+                or 'db_extra' in field.tags
+                or column['type'] in ('json', 'jsonb')
+            )
+            array = column['type'].endswith('[]') and not json_value
+
+            columns.append({
+                'name': name,
+                'type': column['type'],
+                'param': (
+                    'TEXT' if array
+                    else column['type'] if not json_value
+                    or column['type'] in ('json', 'jsonb')
+                    else 'JSONB'
+                ),
+                'array': array,
+                'extra': 'db_extra' in field.tags,
+                'json': json_value,
+                'default': column['default'] if (
+                    'db_default' in field.tags or name in table.pkey
+                ) else None,
+            })
+
+        return columns
+
+    @staticmethod
+    def _column_value(column, instance, literal=True):
+        value = getattr(instance, column['name'])
+        return BaseModel._encode(column, value, literal)
+
+    @staticmethod
+    def _encode(column, value, literal=True):
+        if value is None:
+            return None
+
+        if column['extra'] and hasattr(value, 'result_dict'):
+            return json.dumps(value.result_dict)
+
+        if column['json']:
+            return json.dumps(value)
+
+        # Arrays of arrays can't be unnested, statements send them as text.
+        # COPY sends arrays natively
+        if column['array'] and literal:
+            return BaseModel._array_literal(value)
+
+        if hasattr(value, 'postgresql'):
+            return value.postgresql()
+
+        return value
+
+    @staticmethod
+    def _array_literal(value):
+        """ Text representation of the array, e.g. `{{1,2},{3,NULL}}` """
+
+        items = []
+
+        for item in value:
+            if item is None:
+                items.append('NULL')
+            elif isinstance(item, (list, tuple)):
+                items.append(BaseModel._array_literal(item))
+            else:
+                if isinstance(item, bool):
+                    item = 't' if item else 'f'
+                elif isinstance(item, dict):
+                    item = json.dumps(item)
+                elif hasattr(item, 'postgresql'):
+                    item = item.postgresql()
+
+                item = str(item).replace('\\', '\\\\').replace('"', '\\"')
+                items.append(f'"{item}"')
+
+        return '{' + ','.join(items) + '}'
+
+    @classmethod
+    def _coercer(cls, column):
+        """ Coercion of raw values of the column by its attribute """
+
+        name = column['name']
+        field = cls.meta.fields[name]
+        validators = list(field.validators.items())
+
+        def coerce(value):
+            if field.always or not field._check(value):
+                try:
+                    value = field.coerce(value)
+                except ErrorRequest:
+                    # Coerced only with the instance, the raw value is sent
+                    pass
+                else:
+                    if value is not None and not field._check(value):
+                        raise ErrorInvalid(name)
+
+            if value is None:
+                if field.required:
+                    raise ErrorInvalid(name)
+                return None
+
+            for validator_name, validate in validators:
+                try:
+                    valid = validate(value)
+                except ErrorRequest:
+                    continue
+
+                if not valid:
+                    raise ErrorInvalid(f'{name}#{validator_name}: {value}')
+
+            return cls._encode(column, value, False)
+
+        return coerce
+
+    @classmethod
+    async def copy_in(
+        cls,
+        rows,
+        db=None,
+        *,
+        columns=None,
+        merge=False,
+        update=None,
+        queue_size=10000,
+        timeout=None,
+        **kw,
+    ) -> dict:
+        """ Load rows with the binary COPY
+
+        Rows are instances or dicts from a sync or async iterable, they are
+        streamed to every shard through a bounded queue. Dicts are coerced
+        by the attributes of the model. The columns are `columns`, the keys
+        of the first dict or the fields of the first instance.
+
+        With `merge` rows are copied into a temporary table and upserted
+        like `save_many`, on conflict `update` columns (all the copied ones
+        by default) are replaced. `timeout` limits each statement, by
+        default only the deadline of the scope does, not the query timeout
+        of the pool. Returns the count and the rate of rows
+        """
+
+        started = time.monotonic()
+        rows = cls._iterate(rows)
+        first = await cls._next(rows)
+
+        if first is None:
+            return {'rows': 0, 'seconds': 0, 'rows_per_second': 0}
+
+        if columns is None:
+            if isinstance(first, dict):
+                columns = list(first)
+            else:
+                columns = [name for name, _ in first.items('new')]
+
+        db = cls.get_db(db)
+        table = cls.meta.table
+        conflict = table.conflict_key or table.pkey
+        specs = cls._column_specs(await cls.columns(db), set(columns))
+        coercers = [cls._coercer(column) for column in specs]
+        nshards = len(dbh.get(db.get('db')).shards)
+        queues = [asyncio.Queue(maxsize=queue_size) for _ in range(nshards)]
+        positions = {column['name']: i for i, column in enumerate(specs)}
+        count = 0
+
+        def limit():
+            # Loads take longer than the queries the pool timeout is for
+            left = remaining(timeout)
+            return NO_TIMEOUT if left is None else left
+
+        def record(row):
+            if isinstance(row, dict):
+                return tuple(
+                    coerce(row.get(column['name']))
+                    for column, coerce in zip(specs, coercers)
+                )
+
+            return tuple(
+                cls._column_value(column, row, False)
+                for column in specs
+            )
+
+        async def produce():
+            nonlocal count
+            row = first
+
+            while row is not None:
+                values = record(row)
+
+                if nshards > 1:
+                    # Routed by the coerced values like `save` and `get`
+                    key = [
+                        values[positions[name]] if name in positions else None
+                        for name in table.pkey
+                    ]
+                    shard = cls.route_db(db, key).get('shard') or 0
+                else:
+                    shard = 0
+
+                await queues[shard].put(values)
+                count += 1
+                row = await cls._next(rows)
+
+            for queue in queues:
+                await queue.put(None)
+
+        async def consume(queue):
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                yield item
+
+        async def copy(shard, queue):
+            temp = f'_copy_{table.name}'
+            names = [column['name'] for column in specs]
+
+            async with dbh(**{**db, 'shard': shard}) as conn:
+                if not merge:
+                    await conn.copy_records_to_table(
+                        table.name,
+                        schema_name=table.schema,
+                        columns=names,
+                        records=consume(queue),
+                        timeout=limit(),
+                    )
+                    return
+
+                async with conn.transaction():
+                    sql, args = sqlt('copy_temp.sqlt', {
+                        'temp': temp,
+                        'table': table,
+                        'columns': specs,
+                    })
+                    await conn.execute(sql, *args, timeout=limit())
+
+                    await conn.copy_records_to_table(
+                        temp,
+                        columns=names,
+                        records=consume(queue),
+                        timeout=limit(),
+                    )
+
+                    sql, args = sqlt('save_many.sqlt', {
+                        **kw,
+                        'table': table,
+                        'fields': cls.meta.fields,
+                        'columns': [
+                            {**column, 'array': False} for column in specs
+                        ],
+                        'source': temp,
+                        'extras': [],
+                        'conflict': conflict,
+                        'update': [
+                            name for name in (update or names)
+                            if name not in conflict
+                        ],
+                        'sqlbase': cls.sqlbase(),
+                        'shard': shard,
+                    })
+                    await conn.execute(sql, *args, timeout=limit())
+
+        async with cls._deadline_for('copy_in'):
+            tasks = [asyncio.ensure_future(produce())] + [
+                asyncio.ensure_future(copy(shard, queue))
+                for shard, queue in enumerate(queues)
+            ]
+
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                # A failed side must not leave the other one waiting
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+        expire(cls)
+
+        seconds = time.monotonic() - started
+        return {
+            'rows': count,
+            'seconds': seconds,
+            'rows_per_second': count / seconds if seconds else None,
+        }
+
+    @staticmethod
+    async def _next(rows):
+        try:
+            return await rows.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    @staticmethod
+    async def _iterate(rows):
+        if hasattr(rows, '__aiter__'):
+            async for row in rows:
+                yield row
+        else:
+            for row in rows:
+                yield row
+
     async def rm(self, db=None, by='id', **kw):
         """ Remove """
 
-        db = self.get_db(db)
+        db = self.route_db(self.get_db(db), self.get_key())
 
         sql, args = sqlt('rm.sqlt', {
             **kw,
@@ -680,8 +1278,8 @@ class BaseModel(Base):
             'shard': db.get('shard'),
         })
 
-        async with dbh(**db) as conn:
-            data = await conn.fetchrow(sql, *args)
+        async with self._deadline_for('rm'):
+            data = await dbh.query('fetchrow', sql, *args, **db)
 
         if not data:
             raise Exception('Remove exception')
@@ -693,8 +1291,264 @@ class BaseModel(Base):
             setattr(self, k, v)
 
         self.rehashed('-clean')
+
+        identity = IDENTITY.get()
+        if identity is not None:
+            identity.discard(type(self), self.get_key())
+
+        invalidate(self)
         return self
 
+    @classmethod
+    async def rm_many(
+        cls,
+        keys,
+        db=None,
+        by=None,
+        returning=False,
+        chunk_size=10000,
+        **kw,
+    ):
+        """ Remove rows by the keys with one statement per chunk
+
+        Keys are values, tuples for composite keys or instances. Returns
+        the count of removed rows or, with `returning`, the instances
+        """
+
+        removed = [] if returning else 0
+
+        async for data, context in cls._key_chunks(
+            keys, cls.get_db(db), by, chunk_size,
+        ):
+            sql, args = sqlt('rm_many.sqlt', {
+                **kw,
+                **context,
+                'returning': returning,
+            })
+
+            removed = await cls._rm(sql, args, data, returning, removed)
+
+            identity = IDENTITY.get()
+            if context['key_def'] == tuple(cls.meta.table.pkey):
+                for key in zip(*context['keys']):
+                    if identity is not None:
+                        identity.discard(cls, key)
+                    forget(cls, key)
+            else:
+                expire(cls)
+
+        expire_results(cls)
+        return removed
+
+    @classmethod
+    async def _key_chunks(cls, keys, db, by=None, chunk_size=10000):
+        """ Keys grouped by shards and chunked for `keys.sqlt`
+
+        Yields the database options and the context of the template
+        """
+
+        key_def = tuple(cls.meta.table.pkey) if by is None else (
+            (by,) if isinstance(by, str) else tuple(by)
+        )
+        types = None
+        groups = {}
+
+        if len(key_def) > 1:
+            catalog = await cls.columns(db)
+            types = [catalog[name]['type'] for name in key_def]
+
+        for key in keys:
+            if isinstance(key, BaseModel):
+                key = key.get_key(list(key_def))
+            else:
+                key = cls.coerce_key(
+                    key if isinstance(key, (list, tuple)) else [key], key_def,
+                )
+
+            data = db
+            if key_def == tuple(cls.meta.table.pkey):
+                data = cls.route_db(db, key)
+
+            groups.setdefault(data.get('shard'), (data, []))[1].append(key)
+
+        for data, rows in groups.values():
+            for i in range(0, len(rows), chunk_size):
+                chunk = rows[i:i + chunk_size]
+
+                yield data, {
+                    'key_def': key_def,
+                    'keys': [list(column) for column in zip(*chunk)],
+                    'types': types,
+                    'table': cls.meta.table,
+                    'sqlbase': cls.sqlbase(),
+                    'shard': data.get('shard'),
+                }
+
+    @classmethod
+    async def rm_where(cls, db=None, returning=False, **kw):
+        """ Remove rows matching the conditions with one statement
+
+        Without a shard in `db` rows are removed on every shard. Returns
+        the count of removed rows or, with `returning`, the instances
+        """
+
+        if not kw.get('conditions'):
+            raise ErrorWrong('conditions')
+
+        db = cls.get_db(db)
+        shards = [db.get('shard')] if db.get('shard') is not None else list(
+            range(len(dbh.get(db.get('db')).shards))
+        )
+        removed = [] if returning else 0
+
+        for shard in shards:
+            sql, args = sqlt('rm_where.sqlt', {
+                **kw,
+                'returning': returning,
+                'table': cls.meta.table,
+                'sqlbase': cls.sqlbase(),
+                'shard': shard,
+            })
+
+            removed = await cls._rm(
+                sql, args, {**db, 'shard': shard}, returning, removed,
+            )
+
+        # The removed rows are unknown without fetching them
+        identity = IDENTITY.get()
+        if identity is not None:
+            identity.clear(cls)
+
+        expire(cls)
+        return removed
+
+    @classmethod
+    async def _rm(cls, sql, args, db, returning, removed):
+        async with cls._deadline_for('rm'):
+            if returning:
+                data = await dbh.query('fetch', sql, *args, **db)
+                return removed + [cls(row) for row in data]
+
+            status = await dbh.query('execute', sql, *args, **db)
+
+        return removed + int(status.split()[-1])
+
+    @classmethod
+    async def get_many(
+        cls,
+        keys,
+        db=None,
+        by=None,
+        max_lag=None,
+        hedge=None,
+        chunk_size=10000,
+        cached=True,
+        **kw,
+    ) -> dict:
+        """ Get instances by the keys with one query per chunk
+
+        Returns the instances by their keys, values for single-column
+        keys and tuples for composite ones. Missing keys are omitted.
+        Without `cached` the identity map and the cache are bypassed, the
+        cache is bypassed inside sessions too
+        """
+
+        key_def = tuple(cls.meta.table.pkey) if by is None else (
+            (by,) if isinstance(by, str) else tuple(by)
+        )
+        result = {}
+        identity = IDENTITY.get()
+        cache = cache_of(cls)
+
+        if not cached or kw or key_def != tuple(cls.meta.table.pkey):
+            identity = cache = None
+        if SESSION.get() is not None:
+            # Rows of the transaction aren't visible to the others yet
+            cache = None
+
+        if identity is not None or cache is not None:
+            missing = []
+
+            for key in keys:
+                if isinstance(key, BaseModel):
+                    key = key.get_key()
+                elif not isinstance(key, (list, tuple)):
+                    key = [key]
+
+                instance = None
+                if identity is not None:
+                    instance = identity.get(cls, key)
+
+                if instance is None and cache is not None:
+                    found, row = cache.get(key_def, key)
+                    if found and row is None:
+                        continue
+                    if found:
+                        instance = cls(copy.deepcopy(row))
+                        if identity is not None:
+                            instance = identity.merge(instance)
+
+                if instance is None:
+                    missing.append(key)
+                else:
+                    result[tuple(key) if len(key) > 1 else key[0]] = instance
+
+            keys = missing
+
+        async for data, context in cls._key_chunks(
+            keys, cls.get_read_db(db, max_lag, hedge), by, chunk_size,
+        ):
+            sql, args = sqlt('get_many.sqlt', {**kw, **context})
+            snapshot = cache.snapshot() if cache is not None else None
+
+            async with cls._deadline_for('get_many', 'get'):
+                rows = await dbh.query('fetch', sql, *args, **data)
+
+            for row in rows:
+                if cache is not None:
+                    cache.put(cls.meta.table, row, snapshot)
+
+                instance = cls(row)
+                if data.get('shard') is not None:
+                    instance.actual_shard = data['shard']
+
+                if identity is not None:
+                    instance = identity.merge(instance)
+
+                key = tuple(row[name] for name in key_def)
+                result[key if len(key) > 1 else key[0]] = instance
+
+            if cache is not None:
+                for key in zip(*context['keys']):
+                    if (key if len(key) > 1 else key[0]) not in result:
+                        cache.miss(key_def, key, snapshot)
+
+        return result
+
+    @classmethod
+    async def reload_many(cls, instances, **kw):
+        """ Update the instances according to the data from the DB
+
+        Unsaved data of the found instances is erased, the removed ones
+        are left as they are. Returns the instances found in the DB
+        """
+
+        instances = list(instances)
+        data = await cls.get_many(instances, cached=False, **kw)
+        found = []
+
+        for instance in instances:
+            key = instance.get_key()
+            row = data.get(tuple(key) if len(key) > 1 else key[0])
+            if row is None:
+                continue
+
+            instance.rehash(**dict(row.items('all')))
+            instance.rehashed('-clean')
+            found.append(instance)
+
+        return found
+
     @classmethod
     async def get(
         cls,
@@ -704,11 +1558,86 @@ class BaseModel(Base):
         cursor=None,
         by=None,
         db=None,
+        scatter=False,
+        max_lag=None,
+        hedge=None,
+        batch=None,
+        cached=True,
+        cache_ttl=None,
         **kw,
     ):
-        """ Get instances of the object """
+        """ Get instances of the object
+
+        With `scatter` lists are requested from every shard concurrently
+        and merged in the order of the query. With `batch` (or the `batch`
+        option of the model) concurrent lookups by the primary key are
+        sent together, `True` for one loop iteration or the window in
+        seconds. Without `cached` the identity map and the cache of the
+        model are bypassed, the cache is bypassed inside sessions too.
+        With `cache_ttl` lists are cached like in `fetch`
+        """
 
-        db = cls.get_db(db)
+        db = cls.get_read_db(db, max_lag, hedge)
+
+        if ids:
+            if by is None:
+                by = 'id'
+
+            key_def = (by,) if isinstance(by, str) else tuple(by)
+            key_tuple = cls.coerce_key(
+                ids if isinstance(ids, (list, tuple)) else [ids], key_def,
+            )
+            if not isinstance(ids, (list, tuple)):
+                ids = key_tuple[0]
+
+            identity = IDENTITY.get()
+            if not cached or kw or key_def != tuple(cls.meta.table.pkey):
+                identity = None
+
+            if identity is not None:
+                instance = identity.get(cls, key_tuple)
+                if instance is not None:
+                    return instance
+
+            cache = cache_of(cls)
+            if not cached or kw or key_def not in (
+                cls.meta.table.pkey, *cls.meta.table.keys.values(),
+            ) or SESSION.get() is not None:
+                cache = None
+
+            if cache is not None:
+                found, row = cache.get(key_def, key_tuple)
+                if found:
+                    if row is None:
+                        return None
+
+                    instance = cls(copy.deepcopy(row))
+                    if identity is not None:
+                        instance = identity.merge(instance)
+                    return instance
+
+            if batch is None:
+                batch = getattr(cls.meta, 'batch', None)
+
+            if (
+                batch and cached and not kw
+                and key_def == tuple(cls.meta.table.pkey)
+                and SESSION.get() is None
+            ):
+                batcher = loader(cls, db, 0 if batch is True else batch)
+                if batcher is not None:
+                    instance = await batcher.load(
+                        tuple(key_tuple) if len(key_tuple) > 1
+                        else key_tuple[0]
+                    )
+
+                    if instance is not None and identity is not None:
+                        instance = identity.merge(instance)
+
+                    return instance
+
+            if key_def == cls.meta.table.pkey:
+                db = cls.route_db(db, key_tuple)
 
         kw = {
             **kw,
@@ -720,14 +1649,12 @@ class BaseModel(Base):
             kw['sortby'] = [kw['sortby']]
 
         if ids:
-            if by is None:
-                by = 'id'
             tmp = 'get'
             kw = {
                 **kw,
-                'key_def': (by,) if isinstance(by, str) else by,
+                'key_def': key_def,
                 'key': ids,
-                'key_tuple': ids if isinstance(ids, (list, tuple)) else [ids],
+                'key_tuple': key_tuple,
                 'class': cls,
             }
         elif by is None:
@@ -747,12 +1674,33 @@ class BaseModel(Base):
             cursor = Cursor(cursor or kw)
             kw['cursor'] = cursor
 
-        sql, args = sqlt(f'{tmp}.sqlt', kw)
+        shardnos = None
+
+        if scatter and not ids:
+            async with cls._deadline_for(tmp, 'get'):
+                data, shardnos = await cls._scatter(tmp, kw, db, cache_ttl)
+
+        else:
+            sql, args = sqlt(f'{tmp}.sqlt', kw)
+
+            async with cls._deadline_for(tmp, 'get'):
+                if ids:
+                    snapshot = cache.snapshot() if cache is not None else None
+                    data = await dbh.query('fetch', sql, *args, **db)
+                else:
+                    data = await cls._fetch_rows(sql, args, db, cache_ttl)
 
-        async with dbh(**db) as conn:
-            data = await conn.fetch(sql, *args)
+        if cache_ttl and not ids:
+            # Instances must not share values with the cached rows
+            data = [copy.deepcopy(dict(row)) for row in data]
 
         if ids:
+            if cache is not None:
+                if data:
+                    cache.put(cls.meta.table, data[0], snapshot)
+                else:
+                    cache.miss(key_def, key_tuple, snapshot)
+
             if not data:
                 return None
 
@@ -760,6 +1708,9 @@ class BaseModel(Base):
             if isinstance(db, dict) and 'shard' in db:
                 data.actual_shard = db['shard']
 
+            if identity is not None:
+                data = identity.merge(data)
+
             return data
 
         if offset is not None:
@@ -773,6 +1724,10 @@ class BaseModel(Base):
             for i, row in enumerate(data):
                 data[i] = cls(row)
 
+            if shardnos is not None:
+                for item, shardno in zip(data, shardnos):
+                    item.actual_shard = shardno
+
             pager.list = data
 
             return pager.list
@@ -781,22 +1736,119 @@ class BaseModel(Base):
         if cursor.list:
             cursor.serial = str(cursor.list[-1].created)
 
-        if isinstance(db, dict) and 'shard' in db:
+        if shardnos is not None:
+            for item, shardno in zip(cursor.list, shardnos):
+                item.actual_shard = shardno
+
+        elif isinstance(db, dict) and 'shard' in db:
             for item in cursor.list:
                 item.actual_shard = db['shard']
 
         return cursor.list, cursor.cursor_str
 
+    @classmethod
+    async def _scatter(cls, tmp, kw, db, cache_ttl=None):
+        """ Request the list from all shards and merge sorted streams
+
+        The cursor keeps the position of each shard, so the next page
+        continues every shard from its last returned row
+        """
+
+        pager = kw.get('pager')
+        cursor = kw.get('cursor')
+        db = {k: v for k, v in db.items() if k != 'shard'}
+
+        async def fetch_shard(shardno):
+            shard_kw = {**kw, 'shard': shardno}
+
+            if pager is not None:
+                if not pager.disabled:
+                    shard_pager = copy.copy(pager)
+                    shard_pager.sql_offset = 0
+                    shard_pager.sql_limit = pager.sql_offset + pager.sql_limit
+                    shard_kw['pager'] = shard_pager
+
+            elif cursor.serials:
+                shard_cursor = Cursor(cursor)
+                shard_cursor.serial = cursor.serials.get(str(shardno))
+                shard_kw['cursor'] = shard_cursor
+
+            sql, args = sqlt(f'{tmp}.sqlt', shard_kw)
+            rows = await cls._fetch_rows(
+                sql, args, {**db, 'shard': shardno}, cache_ttl,
+            )
+
+            return [(shardno, row) for row in rows]
+
+        streams = await asyncio.gather(*(
+            fetch_shard(shardno)
+            for shardno, _ in enumerate(dbh.get(db.get('db')).shards)
+        ))
+
+        if tmp == 'cursor':
+            sortby, direction = ['created'], cursor.direction
+        else:
+            sortby, direction = kw.get('sortby'), kw.get('sort')
+
+        if sortby:
+            def sort_key(item):
+                row = item[1]
+                return tuple(
+                    (row[name] is None, row[name])
+                    for name in sortby
+                )
+
+            merged = heapq.merge(
+                *streams,
+                key=sort_key,
+                reverse=(direction or 'ASC').upper() == 'DESC',
+            )
+
+        else:
+            merged = itertools.chain(*streams)
+
+        if pager is not None:
+            if not pager.disabled:
+                merged = itertools.islice(
+                    merged,
+                    pager.sql_offset,
+                    pager.sql_offset + pager.sql_limit,
+                )
+
+        elif tmp == 'cursor':
+            merged = itertools.islice(merged, cursor.limit)
+
+        items = list(merged)
+
+        if pager is None:
+            serials = dict(cursor.serials)
+            for shardno, row in items:
+                if 'created' in row:
+                    serials[str(shardno)] = str(row['created'])
+            cursor.serials = serials
+
+        return [row for _, row in items], [shardno for shardno, _ in items]
+
     @classmethod
     async def fetch(
         cls,
         by,
         db=None,
+        max_lag=None,
+        hedge=None,
+        cache_ttl=None,
+        tags=(),
         **kw,
     ):
-        """ RAW request """
+        """ RAW request
 
-        db = cls.get_db(db)
+        With `cache_ttl` the rows are cached for the seconds until a model
+        of the table, or of the tables from `tags`, is changed. Cached
+        rows are shared, so they must not be modified. Inside sessions
+        the cache is bypassed
+        """
+
+        db = cls.get_read_db(db, max_lag, hedge)
         kw = {
             **kw,
             'table': cls.meta.table,
@@ -806,10 +1858,34 @@ class BaseModel(Base):
 
         sql, args = sqlt(f'{by}.sqlt', kw)
 
-        async with dbh(**db) as conn:
-            data = await conn.fetch(sql, *args)
+        async with cls._deadline_for(by, 'fetch'):
+            return await cls._fetch_rows(sql, args, db, cache_ttl, tags)
 
-        return data
+    @classmethod
+    async def _fetch_rows(cls, sql, args, db, cache_ttl=None, tags=()):
+        # Rows of the transaction aren't visible to the others yet
+        if not cache_ttl or SESSION.get() is not None:
+            return await dbh.query('fetch', sql, *args, **db)
+
+        tags = (cls.meta.table.name, *tags)
+        key = repr((
+            sql, args, sorted(
+                (
+                    (name, value) for name, value in db.items()
+                    if name not in REPLICA_OPTIONS
+                ),
+                key=lambda item: item[0],
+            ),
+        ))
+
+        rows = RESULTS.get(key)
+        if rows is not None:
+            return rows
+
+        snapshot = RESULTS.snapshot(tags)
+        rows = await dbh.query('fetch', sql, *args, **db)
+        RESULTS.put(key, rows, cache_ttl, tags, snapshot)
+        return list(rows)
 
     async def reload(self, **kw):
         """ Update the instance according to the data from the DB
@@ -817,7 +1893,7 @@ class BaseModel(Base):
         After calling this function, all unsaved instance data will be erased
         """
 
-        data = await self.get(self.get_key(), **kw)
+        data = await self.get(self.get_key(), cached=False, **kw)
         self.rehash(**dict(data.items('all')))
         self.rehashed('-clean')
         return self
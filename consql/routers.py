@@ -0,0 +1,95 @@
+"""
+Shard routers
+"""
+
+import bisect
+import hashlib
+
+from . import _json as json
+
+
+def key_hash(key):
+    """ Stable 64-bit hash of the key """
+
+    if not isinstance(key, (list, tuple)):
+        key = [key]
+
+    data = json.dumps(list(key)).encode()
+    digest = hashlib.blake2b(data, digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+def jump_hash(value: int, buckets: int) -> int:
+    """ Jump consistent hash (Lamping & Veach) """
+
+    b, j = -1, 0
+
+    while j < buckets:
+        b = j
+        value = (value * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * (float(1 << 31) / float((value >> 33) + 1)))
+
+    return b
+
+
+class JumpHashRouter:
+    """ Jump hash over the key
+
+    Minimal reshuffling when shards are appended to the end of the list
+    """
+
+    def __call__(self, key, nshards: int) -> int:
+        if nshards <= 1:
+            return 0
+
+        return jump_hash(key_hash(key), nshards)
+
+    def __repr__(self):
+        return '<JumpHashRouter>'
+
+
+class HashRingRouter:
+    """ Consistent hashing ring with virtual nodes """
+
+    def __init__(self, vnodes: int = 64):
+        self.vnodes = vnodes
+        self._rings = {}
+
+    def _ring(self, nshards):
+        ring = self._rings.get(nshards)
+
+        if ring is None:
+            points = sorted(
+                (key_hash(('shard', shard, vnode)), shard)
+                for shard in range(nshards)
+                for vnode in range(self.vnodes)
+            )
+            ring = (
+                [point for point, _ in points],
+                [shard for _, shard in points],
+            )
+            self._rings[nshards] = ring
+
+        return ring
+
+    def __call__(self, key, nshards: int) -> int:
+        if nshards <= 1:
+            return 0
+
+        points, shards = self._ring(nshards)
+        i = bisect.bisect(points, key_hash(key))
+
+        if i == len(points):
+            i = 0
+
+        return shards[i]
+
+    def __repr__(self):
+        return f'<HashRingRouter vnodes={self.vnodes}>'
+
+
+__all__ = (
+    'key_hash',
+    'jump_hash',
+    'JumpHashRouter',
+    'HashRingRouter',
+)
@@ -10,6 +10,7 @@ class Table:
     _keys = None
     _conflict = None
     _conflict_keyname = None
+    _router = None
 
     @property
     def primary_key(self):
@@ -41,9 +42,22 @@ class Table:
     def conflict_keyname(self):
         return self._conflict_keyname
 
-    def __init__(self, name, pkey='id', keys=None, conflict=None, schema=None):
+    @property
+    def router(self):
+        return self._router
+
+    def __init__(
+        self,
+        name,
+        pkey='id',
+        keys=None,
+        conflict=None,
+        schema=None,
+        router=None,
+    ):
         self._name = name
         self._schema = schema
+        self._router = router
 
         if isinstance(pkey, str):
             self._pkey = (pkey,)
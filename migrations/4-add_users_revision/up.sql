@@ -0,0 +1 @@
+ALTER TABLE "users" ADD COLUMN "revision" INTEGER NOT NULL DEFAULT 0;
@@ -1,6 +1,12 @@
+import asyncio
+
 import pytest
 from libdev.gen import generate
 
+import consql
+from consql._cache import cache_of
+from consql._db import dbh
+
 from tests.models.test_instance import User
 
 
@@ -42,3 +48,207 @@ async def test_simple():
     )
     assert len(users) == 1
     assert users[0].id == user.id
+
+@pytest.mark.asyncio
+async def test_scatter():
+    for _ in range(5):
+        await User(login=generate()).save()
+
+    # Pager
+    users = await User.get(offset=0, limit=3, sortby='id')
+    users_scatter = await User.get(
+        offset=0, limit=3, sortby='id', scatter=True,
+    )
+    assert [user.id for user in users_scatter] == [user.id for user in users]
+
+    # Cursor
+    users, cursor = await User.get(direction='ASC', scatter=True)
+    assert len(users) >= 5
+    assert all(hasattr(user, 'actual_shard') for user in users)
+
+    for _ in range(2):
+        await User(login=generate()).save()
+    users, _ = await User.get(cursor=cursor, scatter=True)
+    assert len(users) == 2
+
+@pytest.mark.asyncio
+async def test_deadline():
+    await User(login=generate()).save()
+
+    async with consql.deadline(5):
+        users = await User.get(offset=0)
+    assert len(users) >= 1
+
+    with pytest.raises(asyncio.TimeoutError):
+        async with consql.deadline(0):
+            await User.get(offset=0)
+
+@pytest.mark.asyncio
+async def test_deadline_first_acquire():
+    # The first acquire in the loop starts the health checks
+    async with consql.deadline(0.5):
+        await User.get(offset=0)
+
+    await asyncio.sleep(0.6)
+
+    # Probes after the deadline of that request still reach the hosts
+    for shard in dbh.get(User.database).shards:
+        shard._recheck()
+    await asyncio.sleep(0.2)
+
+    users = await User.get(offset=0)
+    assert len(users) >= 1
+
+@pytest.mark.asyncio
+async def test_singleflight():
+    user = User(login=generate())
+    await user.save()
+
+    shard = dbh.get(User.database).shards[0]
+    coalesced = shard.coalesced
+
+    rows = await asyncio.gather(*(
+        shard.query(
+            'fetch', 'SELECT * FROM "users" WHERE "id" = $1', user.id,
+            singleflight=True,
+        )
+        for _ in range(5)
+    ))
+
+    assert shard.coalesced - coalesced == 4
+    assert all(row == rows[0] for row in rows)
+
+    # Every caller gets its own copy
+    rows[0][0]['tags'].append('changed')
+    assert rows[1][0]['tags'] == []
+
+@pytest.mark.asyncio
+async def test_get_many():
+    users = [User(login=generate()) for _ in range(3)]
+    await User.save_many(users)
+
+    data = await User.get_many([users[0].id, users[2].id, 0])
+    assert set(data) == {users[0].id, users[2].id}
+    assert data[users[2].id].login == users[2].login
+
+    users[1].login = 'changed'
+    assert await User.reload_many(users[:2]) == users[:2]
+    assert users[1].login != 'changed'
+
+@pytest.mark.asyncio
+async def test_get_batch():
+    users = [User(login=generate()) for _ in range(3)]
+    await User.save_many(users)
+
+    ids = [user.id for user in users] + [users[0].id, 0]
+    data = await asyncio.gather(*(
+        User.get(ids=[id_] if id_ else [-1], batch=True) for id_ in ids
+    ))
+
+    assert [user and user.id for user in data] == ids[:-1] + [None]
+    assert data[0] is not data[3]
+
+    # Callers of the same key don't share the instance
+    data[0].name = 'Ivan'
+    assert data[3].name is None
+
+    # A wrong key doesn't fail the other lookups of the batch
+    data = await asyncio.gather(
+        User.get(ids=[users[1].id], batch=True),
+        User.get(ids=['wrong'], batch=True),
+        return_exceptions=True,
+    )
+    assert data[0].id == users[1].id
+    assert isinstance(data[1], Exception)
+
+@pytest.mark.asyncio
+async def test_identity_map():
+    user = User(login=generate())
+    await user.save()
+
+    async with consql.identity_map():
+        # Rows loaded in the scope are the same instances
+        loaded = await User.get(user.id)
+        assert loaded is not user
+        assert await User.get(user.id) is loaded
+        assert (await User.get_many([user.id]))[user.id] is loaded
+
+        # So are the instances saved in the scope
+        user = User(login=generate())
+        await user.save()
+        assert await User.get(user.id) is user
+        assert (await User.get_many([user.id]))[user.id] is user
+
+        await user.rm()
+        assert await User.get(user.id) is None
+
+    assert await User.get(user.id) is None
+
+@pytest.mark.asyncio
+async def test_cache():
+    class CachedUser(User, cache={'size': 100, 'negative_ttl': 60}):
+        pass
+
+    user = CachedUser(login=generate())
+    await user.save()
+
+    assert (await CachedUser.get(user.id)).login == user.login
+    assert (await CachedUser.get(user.id)).login == user.login
+    assert CachedUser.cache_stats()['hits'] == 1
+
+    user.login = generate()
+    await user.save()
+    assert (await CachedUser.get(user.id)).login == user.login
+
+    await user.rm()
+    assert await CachedUser.get(user.id) is None
+
+    # Rows of a rolled back transaction aren't cached
+    with pytest.raises(ValueError):
+        async with CachedUser.session(transaction=True):
+            user = await CachedUser(login=generate()).save()
+            assert await CachedUser.get(user.id)
+            raise ValueError()
+
+    assert await CachedUser.get(user.id) is None
+
+    # A row fetched before the change isn't cached after it
+    cache = cache_of(CachedUser)
+    snapshot = cache.snapshot()
+    cache.invalidate(CachedUser.meta.table, (user.id,))
+    cache.put(CachedUser.meta.table, {'id': user.id}, snapshot)
+    assert cache.get(('id',), (user.id,)) == (False, None)
+
+@pytest.mark.asyncio
+async def test_result_cache():
+    login = generate()
+    conditions = [('login', login)]
+
+    count = await User.fetch('count', conditions=conditions, cache_ttl=60)
+    assert count[0]['count'] == 0
+
+    await User(login=login).save()
+
+    count = await User.fetch('count', conditions=conditions, cache_ttl=60)
+    assert count[0]['count'] == 1
+
+    users, _ = await User.get(conditions=conditions, cache_ttl=60)
+    users[0].name = 'Ivan'
+    users, _ = await User.get(conditions=conditions, cache_ttl=60)
+    assert users[0].name is None
+
+    # Results of a rolled back transaction aren't cached
+    login = generate()
+    conditions = [('login', login)]
+
+    with pytest.raises(ValueError):
+        async with User.session(transaction=True):
+            await User(login=login).save()
+            count = await User.fetch(
+                'count', conditions=conditions, cache_ttl=60,
+            )
+            assert count[0]['count'] == 1
+            raise ValueError()
+
+    count = await User.fetch('count', conditions=conditions, cache_ttl=60)
+    assert count[0]['count'] == 0
@@ -6,7 +6,7 @@ from libdev.codes import USER_STATUSES, LOCALES
 from libdev.gen import generate
 
 from . import Base, Attribute, Table, Extra
-from consql import coerces
+from consql import coerces, LsnToken, UnitOfWork
 
 
 def coerce_list(value):
@@ -81,6 +81,7 @@ class User(Base, table=Table('users')):
         default=coerces.now,
         coerce=coerces.date_time,
     )
+    revision = Attribute(types=int, required=False, default=0)
 
 
 @pytest.mark.asyncio
@@ -168,6 +169,7 @@ async def test_simple():
         'options': [],
         'created': user_created, # specified value
         'updated': user.updated, # automatic value
+        'revision': 0,
     }
 
     # Remove
@@ -191,3 +193,139 @@ async def test_simple():
     assert (await User.fetch('count', conditions=[
         ('name', 'Ivan'),
     ]))[0]['count'] == 0
+
+@pytest.mark.asyncio
+async def test_read_your_writes():
+    token = LsnToken()
+
+    user = User(login=generate())
+    await user.save(db={'token': token})
+    assert token
+
+    user = await User.get(user.id, db={'token': token})
+    assert isinstance(user, User)
+
+    token = LsnToken(str(token))
+    users, _ = await User.get(
+        conditions=[('login', user.login)],
+        db={'token': token},
+    )
+    assert len(users) == 1
+
+    # The position of a transaction is taken after its commit
+    token = LsnToken()
+
+    async with User.session(transaction=True):
+        user = User(login=generate())
+        await user.save(db={'token': token})
+        assert not token
+
+    assert token
+    assert isinstance(await User.get(user.id, db={'token': token}), User)
+
+@pytest.mark.asyncio
+async def test_session():
+    login = generate()
+
+    async with User.session(transaction=True):
+        user = await User(login=login).save()
+        assert (await User.get(user.id)).login == login
+
+    assert await User.get(user.id)
+
+    with pytest.raises(ValueError):
+        async with User.session(transaction=True):
+            user = await User(login=generate()).save()
+            raise ValueError()
+
+    assert await User.get(user.id) is None
+
+@pytest.mark.asyncio
+async def test_unit_of_work():
+    users = [User(login=generate()) for _ in range(3)]
+
+    async with UnitOfWork() as unit:
+        unit.add(*users)
+
+    assert all(user.id for user in users)
+
+    users[0].name = 'Ivan'
+    users[1].extra['key'] = 'value'
+
+    await UnitOfWork().add(*users).flush()
+
+    assert (await User.get(users[0].id)).name == 'Ivan'
+    assert (await User.get(users[1].id)).extra['key'] == 'value'
+
+@pytest.mark.asyncio
+async def test_save_many():
+    users = [
+        User(login=generate(), tags=['a', 'b'], extra={'n': i})
+        for i in range(10)
+    ]
+
+    await User.save_many(users, chunk_size=4)
+    assert all(user.id for user in users)
+    assert users[3].tags == ['a', 'b']
+    assert users[3].extra['n'] == 3
+
+    users[0].name = 'Ivan'
+    users[1].extra['m'] = 1
+    del users[1].extra['n']
+    await User.save_many(users[:2])
+    assert (await User.get(users[0].id)).name == 'Ivan'
+    assert users[0].revision == 1
+
+    # The row changed elsewhere keeps the keys not touched by the batch
+    other = await User.get(users[1].id)
+    other.extra['k'] = 'v'
+    await other.save()
+    assert other.revision == 2
+
+    users[1].extra['m'] = 2
+    await User.save_many([users[1]])
+
+    user = await User.get(users[1].id)
+    assert user.extra == {'m': 2, 'k': 'v'}
+    assert user.revision == 3
+
+@pytest.mark.asyncio
+async def test_copy_in():
+    logins = [generate() for _ in range(5)]
+
+    async def rows():
+        for login in logins:
+            yield {'login': login, 'tags': ['a'], 'extra': {'n': 1}}
+
+    stats = await User.copy_in(rows(), timeout=60)
+    assert stats['rows'] == 5
+    assert stats['rows_per_second']
+
+    users, _ = await User.get(conditions=[('login', logins[0])])
+    assert users[0].tags == ['a']
+
+    users[0].name = 'Ivan'
+    await User.copy_in([users[0]], columns=['id', 'name'], merge=True)
+    assert (await User.get(users[0].id)).name == 'Ivan'
+
+    # Extras are merged into the stored ones
+    await User.copy_in(
+        [{'id': users[0].id, 'extra': {'m': 2}}],
+        columns=['id', 'extra'],
+        merge=True,
+    )
+    assert (await User.get(users[0].id)).extra == {'n': 1, 'm': 2}
+
+@pytest.mark.asyncio
+async def test_rm_many():
+    users = [User(login=generate()) for _ in range(4)]
+    await User.save_many(users)
+
+    assert await User.rm_many([users[0], users[1].id]) == 2
+    assert await User.get(users[0].id) is None
+
+    removed = await User.rm_many([users[2].id], returning=True)
+    assert removed[0].login == users[2].login
+
+    assert await User.rm_where(conditions=[('login', users[3].login)]) == 1
+    assert await User.get(users[3].id) is None
@@ -36,3 +36,12 @@ async def test_simple():
     assert str(priority)[:15] == "Object Priority"
 
     await priority.save()
+
+@pytest.mark.asyncio
+async def test_get_many():
+    priority = Priority(category=2, brand=3, sex='female', status=1)
+    await priority.save()
+
+    data = await Priority.get_many([(2, 3, 'female'), (2, 3, 'male')])
+    assert list(data) == [(2, 3, 'female')]
+    assert data[(2, 3, 'female')].status == 1
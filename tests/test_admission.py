@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+
+from consql.errors import ErrorOverload, ErrorWrong
+from consql._admission import Admission
+
+
+async def _queue(admission, *priorities):
+    tasks = [
+        asyncio.ensure_future(admission.acquire(priority))
+        for priority in priorities
+    ]
+    await asyncio.sleep(0)
+    return tasks
+
+@pytest.mark.asyncio
+async def test_priority():
+    admission = Admission(concurrency=1)
+    token = await admission.acquire('default')
+
+    tasks = await _queue(admission, 'background', 'default', 'interactive')
+    assert len(admission) == 3
+
+    order = []
+    while tasks:
+        admission.release(token)
+        done, _ = await asyncio.wait(
+            tasks, timeout=1, return_when=asyncio.FIRST_COMPLETED,
+        )
+        assert len(done) == 1
+        task = done.pop()
+        tasks.remove(task)
+        token = task.result()
+        order.append(token[0])
+
+    assert order == ['interactive', 'default', 'background']
+
+@pytest.mark.asyncio
+async def test_class_limit():
+    admission = Admission(concurrency=3, classes={
+        'default': {'priority': 0},
+        'background': {'priority': 1, 'limit': 1},
+    })
+
+    background = await admission.acquire('background')
+    waiting = await _queue(admission, 'background')
+    assert not waiting[0].done()
+
+    # Other classes are admitted past the waiter at the limit
+    token = await admission.acquire()
+    assert token[0] == 'default'
+    assert admission.json()['classes']['background']['active'] == 1
+
+    admission.release(background)
+    assert (await waiting[0])[0] == 'background'
+
+    with pytest.raises(ErrorWrong):
+        await admission.acquire('unknown')
+
+@pytest.mark.asyncio
+async def test_reject():
+    admission = Admission(concurrency=1, queue_size=1)
+    token = await admission.acquire()
+
+    tasks = await _queue(admission, 'default')
+    with pytest.raises(ErrorOverload):
+        await admission.acquire()
+    assert admission.classes['default']['rejected'] == 1
+
+    admission.release(token)
+    admission.release(await tasks[0])
+
+    # The wait is estimated by the hold time of the admitted requests
+    admission = Admission(concurrency=2, max_wait=0.9)
+    admission.hold = 1
+    tokens = [await admission.acquire() for _ in range(2)]
+    assert admission.estimate('default') == 0.5
+
+    tasks = await _queue(admission, 'interactive')
+    assert admission.estimate('interactive') == 1
+    assert admission.estimate('background') == 1
+    with pytest.raises(ErrorOverload):
+        await admission.acquire('background')
+
+    for token in tokens:
+        admission.release(token)
+    admission.release(await tasks[0])
+
+@pytest.mark.asyncio
+async def test_cancel():
+    admission = Admission(concurrency=1)
+    token = await admission.acquire()
+
+    with pytest.raises(asyncio.TimeoutError):
+        await admission.acquire(timeout=0.01)
+    assert len(admission) == 0
+
+    tasks = await _queue(admission, 'default', 'background')
+    tasks[0].cancel()
+    await asyncio.gather(tasks[0], return_exceptions=True)
+    assert len(admission) == 1
+
+    # The slot goes to the next waiter, not to the cancelled one
+    admission.release(token)
+    token = await asyncio.wait_for(tasks[1], 1)
+    assert token[0] == 'background'
+    assert admission.active == 1
+
+    admission.release(token)
+    assert admission.active == 0
+    assert all(klass['active'] == 0 for klass in admission.classes.values())
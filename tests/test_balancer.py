@@ -0,0 +1,61 @@
+import collections
+import random
+
+from consql._db import PgShard
+
+
+def _shard(**opts):
+    return PgShard('host=balancer dbname=balancer user=u password=p', **opts)
+
+def _host(no, inflight=0, latency=None):
+    return {'no': no, 'inflight': inflight, 'latency': latency}
+
+def test_p2c():
+    random.seed(0)
+    shard = _shard(balancer='p2c')
+    hosts = [_host(0), _host(1, inflight=5), _host(2, latency=0.1)]
+
+    assert shard._choose(hosts[1:2]) is hosts[1]
+
+    # The most loaded host loses every pair
+    counts = collections.Counter(
+        shard._choose(hosts)['no'] for _ in range(1000)
+    )
+    assert set(counts) == {0, 1}
+    assert counts[0] > counts[1]
+
+    # Load is in-flight acquires weighted by the latency
+    assert shard._load(_host(0, 1, 0.01)) < shard._load(_host(0, 0, 0.1))
+    assert shard._load(_host(0, 3)) < shard._load(_host(0, 4))
+
+def test_random():
+    random.seed(0)
+    shard = _shard()
+    hosts = [_host(0), _host(1, inflight=100)]
+
+    counts = collections.Counter(
+        shard._choose(hosts)['no'] for _ in range(1000)
+    )
+    assert min(counts.values()) > 400
+
+def test_hedge_delay():
+    shard = _shard(hedge_percentile=90, hedge_min_delay=0.002, hedge_window=100)
+    shard.hedge_min_samples = 20
+
+    for i in range(19):
+        shard.observe_read((i + 1) / 1000)
+    assert shard.hedge_delay() is None
+
+    for i in range(19, 100):
+        shard.observe_read((i + 1) / 1000)
+    assert shard.hedge_delay() == 0.091
+
+    # Fast reads don't go below the minimum delay
+    for _ in range(100):
+        shard.observe_read(0.0001)
+    assert shard.hedge_delay() == 0.002
+
+    # The delay follows the window after it is full
+    for _ in range(100):
+        shard.observe_read(0.05)
+    assert shard.hedge_delay() == 0.05
@@ -0,0 +1,53 @@
+import pytest
+
+from consql import make_base, Attribute, Table
+from consql._cache import RESULTS, cache_of, invalidate
+from consql._db import Session
+
+
+Cached = make_base(None, 'cached', shards=[
+    {'host': 'cached', 'dbname': 'cached', 'user': 'u', 'password': 'p'},
+])
+
+
+class Item(Cached, table=Table('items'), cache={'size': 100}):
+    id = Attribute(types=int, required=False)
+    title = Attribute(types=str, default='')
+
+
+@pytest.mark.asyncio
+async def test_invalidate_on_commit():
+    cache = cache_of(Item)
+    item = Item(id=1, title='new')
+
+    async with Session('cached', transaction=True):
+        invalidate(item)
+        assert cache.get(('id',), (1,)) == (False, None)
+
+        # A reader outside the transaction still sees the old row
+        cache.put(Item.meta.table, {'id': 1, 'title': 'old'}, cache.snapshot())
+        assert cache.get(('id',), (1,))[0]
+
+    assert cache.get(('id',), (1,)) == (False, None)
+
+    # Rows read after a rollback stay cached
+    with pytest.raises(ValueError):
+        async with Session('cached', transaction=True):
+            invalidate(item)
+            cache.put(Item.meta.table, {'id': 1, 'title': 'old'}, cache.snapshot())
+            raise ValueError
+
+    assert cache.get(('id',), (1,))[0]
+
+@pytest.mark.asyncio
+async def test_results_on_commit():
+    tags = ('items',)
+
+    async with Session('cached', transaction=True):
+        invalidate(Item(id=2))
+
+        # A count read outside the transaction before the commit
+        RESULTS.put('count', [{'count': 1}], 60, tags, RESULTS.snapshot(tags))
+        assert RESULTS.get('count') is not None
+
+    assert RESULTS.get('count') is None
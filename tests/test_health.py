@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+from consql._db import HealthScheduler, PgShard
+
+
+@pytest.mark.asyncio
+async def test_independent_probes(monkeypatch):
+    probes = []
+
+    async def check_pool(self, hostno):
+        stat_host = self.stat[hostno]
+        probes.append(stat_host['host'])
+
+        # The host doesn't answer until the connect timeout
+        if stat_host['host'] == 'dead':
+            await asyncio.sleep(60)
+
+        PgShard._set_mode(stat_host, 'master')
+
+    monkeypatch.setattr(PgShard, '_check_pool', check_pool)
+
+    scheduler = HealthScheduler()
+    shards = [
+        PgShard(
+            f'host={host} dbname=health user=u password=p',
+            loop=asyncio.get_running_loop(),
+            scheduler=scheduler,
+        )
+        for host in ('dead', 'alive')
+    ]
+
+    for shard in shards:
+        shard.check_interval = 0.01
+        shard.query_last_time = float('inf')
+        scheduler.add(shard)
+
+    await asyncio.sleep(0.2)
+
+    # The hanging probe is not repeated and doesn't block the other host
+    assert probes.count('dead') == 1
+    assert probes.count('alive') > 5
+
+    for shard in shards:
+        scheduler.discard(shard)
+    await asyncio.wait_for(scheduler.task, 1)
+
+    for probe in list(scheduler.probes):
+        probe.cancel()
@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+from asyncpg import DataError
+
+from consql import make_base, Attribute, Table
+from consql.errors import ErrorWrong
+from consql._loader import Loader
+
+
+Loaded = make_base(None, 'loaded', shards=[
+    {'host': 'loaded', 'dbname': 'loaded', 'user': 'u', 'password': 'p'},
+])
+
+
+class Item(Loaded, table=Table('items')):
+    id = Attribute(types=int, required=False)
+
+
+async def _load(monkeypatch, fail):
+    calls = []
+
+    async def get_many(keys, db=None):
+        calls.append(list(keys))
+        for key in keys:
+            if fail(key) is not None:
+                raise fail(key)
+        return {key: Item(id=key) for key in keys}
+
+    monkeypatch.setattr(Item, 'get_many', get_many)
+
+    batcher = Loader(Item, {})
+    data = await asyncio.gather(
+        batcher.load(1), batcher.load(2), return_exceptions=True,
+    )
+    return data, calls
+
+@pytest.mark.asyncio
+async def test_split_on_data_error(monkeypatch):
+    data, calls = await _load(
+        monkeypatch, lambda key: DataError('wrong') if key == 2 else None,
+    )
+
+    assert calls == [[1, 2], [1], [2]]
+    assert data[0].id == 1
+    assert isinstance(data[1], DataError)
+
+@pytest.mark.asyncio
+async def test_no_split_on_failure(monkeypatch):
+    data, calls = await _load(monkeypatch, lambda key: ErrorWrong('down'))
+
+    assert calls == [[1, 2]]
+    assert all(isinstance(error, ErrorWrong) for error in data)
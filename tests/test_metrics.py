@@ -0,0 +1,65 @@
+from consql._metrics import Histogram, HostMetrics, render_prometheus
+
+
+def _host(host, metrics):
+    return {
+        'db': 'main',
+        'shardno': 0,
+        'host': host,
+        'port': 5432,
+        'mode': 'master',
+        'pool': {'size': 3, 'free': 1, 'in_use': 2, 'limit': 5, 'max_size': 10},
+        'metrics': metrics.json(),
+    }
+
+def test_histogram():
+    histogram = Histogram(buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 5):
+        histogram.observe(value)
+
+    data = histogram.json()
+    assert data['buckets'] == [(0.1, 2), (1, 3), ('+Inf', 4)]
+    assert data['count'] == 4
+    assert data['sum'] == 5.65
+
+def test_render_prometheus():
+    metrics = HostMetrics()
+    metrics.query.observe(0.02)
+    metrics.query.observe(20)
+    metrics.acquire_timeouts = 2
+    metrics.transition('not_connected', 'master')
+
+    text = render_prometheus([
+        _host('db1', metrics), _host('db"2', HostMetrics()),
+    ])
+    lines = text.splitlines()
+    labels = 'db="main",shard="0",host="db1",port="5432"'
+
+    # One description per metric for all hosts
+    assert lines.count('# TYPE consql_query_seconds histogram') == 1
+    assert lines.count('# TYPE consql_pool_size gauge') == 1
+    assert '# HELP consql_pool_size Open connections of the pool' in lines
+
+    assert f'consql_pool_in_use{{{labels}}} 2' in lines
+    assert f'consql_host_mode{{{labels},mode="master"}} 1' in lines
+    assert f'consql_acquire_timeouts_total{{{labels}}} 2' in lines
+    assert (
+        f'consql_mode_transitions_total{{{labels},'
+        'from="not_connected",to="master"} 1'
+    ) in lines
+
+    # Buckets are cumulative and end with all observations
+    assert f'consql_query_seconds_bucket{{{labels},le="0.01"}} 0' in lines
+    assert f'consql_query_seconds_bucket{{{labels},le="0.025"}} 1' in lines
+    assert f'consql_query_seconds_bucket{{{labels},le="10"}} 1' in lines
+    assert f'consql_query_seconds_bucket{{{labels},le="+Inf"}} 2' in lines
+    assert f'consql_query_seconds_sum{{{labels}}} 20.02' in lines
+    assert f'consql_query_seconds_count{{{labels}}} 2' in lines
+
+    # Label values are escaped
+    assert any('host="db\\"2"' in line for line in lines)
+
+    assert text.endswith('\n')
+    assert 'consql_pool_size_replica{' in render_prometheus(
+        [_host('db1', metrics)], 'replica',
+    )
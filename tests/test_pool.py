@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from consql._db import PgShard, PoolLimiter
+
+
+@pytest.mark.asyncio
+async def test_limiter():
+    limiter = PoolLimiter(2)
+    assert limiter.try_acquire()
+    await limiter.acquire()
+    assert not limiter.try_acquire()
+
+    waiters = [asyncio.ensure_future(limiter.acquire()) for _ in range(3)]
+    await asyncio.sleep(0)
+    assert len(limiter.waiters) == 3
+
+    # Waiters are woken in order as the slots are freed or added
+    limiter.release()
+    await asyncio.sleep(0)
+    assert [waiter.done() for waiter in waiters] == [True, False, False]
+
+    limiter.resize(4)
+    await asyncio.sleep(0)
+    assert all(waiter.done() for waiter in waiters)
+    assert limiter.active == limiter.peak == 4
+
+    with pytest.raises(asyncio.TimeoutError):
+        await limiter.acquire(timeout=0.01)
+    assert not limiter.waiters
+    assert limiter.active == 4
+
+    for _ in range(4):
+        limiter.release()
+    limiter.reset()
+    assert limiter.active == limiter.peak == 0
+
+def test_autoscale():
+    shard = PgShard(
+        'host=pool dbname=pool user=u password=p',
+        pool_min_size=2,
+        pool_max_size=6,
+        pool_autoscale_wait=0.01,
+    )
+    limiter = shard.stat[0]['limiter']
+    assert limiter.limit == 2
+
+    # Connections are awaited longer than allowed
+    limiter.record(0.05)
+    shard._autoscale()
+    assert limiter.limit == 3
+    assert limiter.acquired == 0
+
+    limiter.record(0.05)
+    shard._autoscale()
+    assert limiter.limit == 4
+
+    # Usage within the limit keeps it
+    for _ in range(2):
+        limiter.try_acquire()
+    limiter.record(0.001)
+    shard._autoscale()
+    assert limiter.limit == 4
+
+    # Less than half of it is used
+    for _ in range(2):
+        limiter.release()
+    limiter.reset()
+    for _ in range(3):
+        shard._autoscale()
+    assert limiter.limit == 2
+
+    # Limits stay within the pool sizes
+    for _ in range(10):
+        limiter.record(1)
+        shard._autoscale()
+    assert limiter.limit == 6
@@ -0,0 +1,71 @@
+import collections
+
+import pytest
+
+from consql import make_base, Attribute, Table
+from consql.errors import ErrorWrong
+from consql.routers import key_hash, jump_hash, JumpHashRouter, HashRingRouter
+from consql._db import PgShards
+
+
+Sharded = make_base(None, 'routers', shards=[
+    {'host': f'shard{i}', 'dbname': 'routers', 'user': 'u', 'password': 'p'}
+    for i in range(4)
+])
+
+
+class Item(Sharded, table=Table('items')):
+    id = Attribute(types=int, required=False, coerce=int)
+
+
+def test_key_hash():
+    assert key_hash(5) == key_hash([5]) == key_hash((5,))
+    assert key_hash(5) != key_hash('5')
+    assert key_hash([1, 'a']) != key_hash(['a', 1])
+
+def test_jump_hash():
+    counts = collections.Counter(jump_hash(key_hash(i), 8) for i in range(8000))
+    assert set(counts) == set(range(8))
+    assert min(counts.values()) > 800
+
+    # Appending a shard only moves keys to it
+    for i in range(1000):
+        before = jump_hash(key_hash(i), 8)
+        after = jump_hash(key_hash(i), 9)
+        assert after in (before, 8)
+
+def test_routers():
+    for router in (JumpHashRouter(), HashRingRouter(vnodes=16)):
+        assert router(5, 1) == 0
+        assert all(0 <= router(i, 4) < 4 for i in range(100))
+        assert router(5, 4) == router([5], 4)
+
+    ring = HashRingRouter(vnodes=16)
+    moved = sum(ring(i, 4) != ring(i, 5) for i in range(1000))
+    assert 0 < moved < 500
+
+def test_logical_shards():
+    shards = PgShards([
+        f'host=shard{i} dbname=routers user=u password=p' for i in range(3)
+    ], nshards=16)
+
+    for i in range(100):
+        assert shards.route(i) == shards.router(i, 16) % 3
+
+    assert shards.route(None) == 0
+    assert shards.route([None]) == 0
+
+def test_route_db():
+    db = Item.get_db()
+
+    # Keys are coerced like the stored ones before hashing
+    assert Item.coerce_key(['5']) == [5]
+    assert (
+        Item.route_db(db, Item.coerce_key(['5']))['shard']
+        == Item.route_db(db, [5])['shard']
+    )
+    assert Item.route_db({**db, 'shard': 2}, [5])['shard'] == 2
+
+    # Keys generated by the database are unknown before the insert
+    with pytest.raises(ErrorWrong):
+        Item.route_db(db, [None])
@@ -0,0 +1,81 @@
+import pytest
+
+from consql import make_base, Attribute, Table
+from consql import model
+
+
+Scattered = make_base(None, 'scattered', shards=[
+    {'host': f'shard{i}', 'dbname': 'scattered', 'user': 'u', 'password': 'p'}
+    for i in range(3)
+])
+
+
+class Item(Scattered, table=Table('items')):
+    id = Attribute(types=int, required=False)
+    created = Attribute(types=int)
+
+
+# Shards are filled unevenly and their rows interleave
+ROWS = {
+    0: [1, 2, 3, 4, 5, 9, 12, 13],
+    1: [6, 7, 14],
+    2: [8, 10, 11, 15, 16, 17],
+}
+
+
+@pytest.fixture
+def queries(monkeypatch):
+    queries = []
+
+    # The cursor of the shard instead of the rendered SQL
+    monkeypatch.setattr(model, 'sqlt', lambda name, kw: (name, kw))
+
+    async def fetch_rows(sql, args, db, cache_ttl=None):
+        cursor = args['cursor']
+        queries.append((db['shard'], cursor.serial))
+
+        rows = ROWS[db['shard']]
+        if cursor.direction == 'DESC':
+            rows = rows[::-1]
+
+        if cursor.serial is not None:
+            serial = int(cursor.serial)
+            rows = [
+                created for created in rows
+                if (created > serial if cursor.direction == 'ASC'
+                    else created < serial)
+            ]
+
+        return [
+            {'id': created, 'created': created}
+            for created in rows[:cursor.limit]
+        ]
+
+    monkeypatch.setattr(Item, '_fetch_rows', fetch_rows)
+    return queries
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('direction', ['ASC', 'DESC'])
+async def test_scatter_cursor(queries, direction):
+    pages = []
+    cursor = {'direction': direction, 'limit': 4}
+
+    while True:
+        items, cursor = await Item.get(cursor=cursor, scatter=True)
+        if not items:
+            break
+        pages.append([item.created for item in items])
+        assert all(item.actual_shard is not None for item in items)
+
+    created = [value for page in pages for value in page]
+    assert created == sorted(
+        (value for rows in ROWS.values() for value in rows),
+        reverse=direction == 'DESC',
+    )
+    assert all(len(page) == 4 for page in pages[:-1])
+
+    # Each shard continues from its own last returned row
+    if direction == 'ASC':
+        assert sorted(queries[3:6]) == [(0, '4'), (1, None), (2, None)]
+    else:
+        assert sorted(queries[3:6]) == [(0, None), (1, '14'), (2, '15')]